@@ -1,14 +1,16 @@
 import pandas as pd
 import numpy as np
-from openpyxl import load_workbook
-from msal import ConfidentialClientApplication
-from simple_salesforce import Salesforce, SalesforceLogin
-from copy import deepcopy
 
 # from dotenv import load_dotenv
 #
 # load_dotenv()
 
+def normalize_values(series):
+    """Function to strip and upper-case the text cells of a single column."""
+    if series.dtype != object:
+        return series
+    return series.map(lambda x: x.strip().upper() if isinstance(x, str) else x)
+
 def main(business_file, query_file, primary_column, output_file):
     input_df = pd.read_excel(business_file, sheet_name='Sheet1')
     query_df = pd.read_excel(query_file)  # Query DF nothing but the system extract data
@@ -22,33 +24,32 @@ def main(business_file, query_file, primary_column, output_file):
     matched_df = pd.merge(input_df, query_df, left_on=primary_column + '_Input', right_on=primary_column + '_Output',
                           how='outer', suffixes=('_Input', '_Output'))
     base_columns = set(col.rsplit('_', 1)[0] for col in matched_df.columns if '_' in col)
-    matched_df_copy = deepcopy(matched_df)
-    matched_df_copy = matched_df_copy.applymap(lambda x: x.strip() if isinstance(x, str) else x)
-    matched_df_copy = matched_df_copy.applymap(lambda x: x.upper() if isinstance(x, str) else x)
     # Adding Status Column
     # import pdb;pdb.set_trace()
+    status_data = {}
     for base_column in base_columns:
         business_column = f'{base_column}_Input'
         system_column = f'{base_column}_Output'
         status_column = f'{base_column}_Status'
-        if business_column in matched_df_copy.columns and system_column in matched_df_copy.columns:
-            # df.value1 = df.value1.round()
-            if business_column in ["Net Price _Input"]:
-                matched_df_copy[business_column] = matched_df_copy[business_column].round()
-                matched_df_copy[system_column] = matched_df_copy[system_column].round()
-                matched_df[status_column] = np.where(matched_df_copy[business_column] == matched_df_copy[system_column], 'Matched',
-                                                 'Not Matched')
-            else:
-                matched_df[status_column] = np.where(matched_df_copy[business_column] == matched_df_copy[system_column],
-                                                     'Matched',
-                                                     'Not Matched')
-            # Get the current column names
-            cols = list(matched_df.columns)
-            cols.remove(business_column)
-            cols.remove(system_column)
-            cols.remove(status_column)
-            cols.extend([business_column, system_column, status_column])
-            matched_df = matched_df[cols]
+        if business_column in matched_df.columns and system_column in matched_df.columns:
+            # Normalize only this pair, in one strip+upper pass, instead of a deep copy of the whole frame
+            business_values = normalize_values(matched_df[business_column])
+            system_values = normalize_values(matched_df[system_column])
+            # Net Price is compared to whole units
+            if business_column == "Net Price_Input":
+                business_values = pd.to_numeric(business_values, errors='coerce').round().fillna(business_values)
+                system_values = pd.to_numeric(system_values, errors='coerce').round().fillna(system_values)
+            status_data[status_column] = np.where(business_values == system_values, 'Matched', 'Not Matched')
+
+    # Lay out the Input/Output/Status triples in a single copy
+    paired_columns = []
+    for status_column in status_data:
+        base_column = status_column[:-len('_Status')]
+        paired_columns.extend([f'{base_column}_Input', f'{base_column}_Output', status_column])
+    paired_set = set(paired_columns)
+    cols = [col for col in matched_df.columns if col not in paired_set] + paired_columns
+    matched_df = pd.DataFrame({col: status_data[col] if col in status_data else matched_df[col] for col in cols},
+                              index=matched_df.index, columns=cols)
     output_file = fr"D:\Work\Output_Sheets\{output_file}_output.xlsx"
     matched_df.to_excel(output_file, index=False)
     print("File Created Successfully.............")
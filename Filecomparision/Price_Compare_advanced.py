@@ -1,56 +1,35 @@
-import pandas as pd
-import numpy as np
-from openpyxl import load_workbook
-from msal import ConfidentialClientApplication
-from simple_salesforce import Salesforce, SalesforceLogin
-from copy import deepcopy
+from compare_engine import (load_rules, merge_rules, get_base_columns, build_shadow_status_matrix, plan_column_layout,
+                            assemble_output_frame, merge_on_key)
+from parallel_status import build_parallel_status_matrix
+from ingest import read_excel_parallel
+from excel_output import write_results
 
 # from dotenv import load_dotenv
 #
 # load_dotenv()
 
-def main(business_file, query_file, primary_column, output_file):
-    input_df = pd.read_excel(business_file, sheet_name='Sheet1')
-    query_df = pd.read_excel(query_file)  # Query DF nothing but the system extract data
+def main(business_file, query_file, primary_column, output_file, rules_file=None, workers=None):
+    # Both files are parsed at the same time in separate processes
+    # Query DF nothing but the system extract data
+    input_df, query_df = read_excel_parallel([(business_file, 'Sheet1'), (query_file, 0)])
 
-    input_df = input_df.rename(columns={primary_column: primary_column + '_Input'})
-    query_df = query_df.rename(columns={primary_column: primary_column + '_Output'})
+    # Merge the two dataframes(Business & System) on the primary column, or on a list of columns such as
+    # ['Business Partner ICV/GUID', 'Material ID'] for a composite key
+    matched_df = merge_on_key(input_df, query_df, primary_column)
+    base_columns = get_base_columns(matched_df)
+    # Adding Status Column, normalizing only the compared columns (missing values never match here);
+    # with workers, the columns are compared in that many processes at once
+    # Net Price is compared to whole units (DEFAULT_RULES) unless the rules file says otherwise
+    rules = merge_rules(load_rules(rules_file) if rules_file else None)
+    status_matrix = (build_parallel_status_matrix(matched_df, base_columns, rules, mode='shadow', fill_missing=False,
+                                                  workers=workers) if workers
+                     else build_shadow_status_matrix(matched_df, base_columns, fill_missing=False, rules=rules))
 
-    matched_df = pd.DataFrame()
-
-    # Merge the two dataframes(Business & System) on the primary column
-    matched_df = pd.merge(input_df, query_df, left_on=primary_column + '_Input', right_on=primary_column + '_Output',
-                          how='outer', suffixes=('_Input', '_Output'))
-    base_columns = set(col.rsplit('_', 1)[0] for col in matched_df.columns if '_' in col)
-    matched_df_copy = deepcopy(matched_df)
-    matched_df_copy = matched_df_copy.applymap(lambda x: x.strip() if isinstance(x, str) else x)
-    matched_df_copy = matched_df_copy.applymap(lambda x: x.upper() if isinstance(x, str) else x)
-    # Adding Status Column
-    # import pdb;pdb.set_trace()
-    for base_column in base_columns:
-        business_column = f'{base_column}_Input'
-        system_column = f'{base_column}_Output'
-        status_column = f'{base_column}_Status'
-        if business_column in matched_df_copy.columns and system_column in matched_df_copy.columns:
-            # df.value1 = df.value1.round()
-            if business_column in ["Net Price _Input"]:
-                matched_df_copy[business_column] = matched_df_copy[business_column].round()
-                matched_df_copy[system_column] = matched_df_copy[system_column].round()
-                matched_df[status_column] = np.where(matched_df_copy[business_column] == matched_df_copy[system_column], 'Matched',
-                                                 'Not Matched')
-            else:
-                matched_df[status_column] = np.where(matched_df_copy[business_column] == matched_df_copy[system_column],
-                                                     'Matched',
-                                                     'Not Matched')
-            # Get the current column names
-            cols = list(matched_df.columns)
-            cols.remove(business_column)
-            cols.remove(system_column)
-            cols.remove(status_column)
-            cols.extend([business_column, system_column, status_column])
-            matched_df = matched_df[cols]
+    # Lay out the Input/Output/Status triples in a single copy
+    matched_df = assemble_output_frame(matched_df, status_matrix.expand_all(),
+                                       plan_column_layout(matched_df.columns, status_matrix.status_columns))
     output_file = fr"D:\Work\Output_Sheets\{output_file}_output.xlsx"
-    matched_df.to_excel(output_file, index=False)
+    write_results(output_file, [('Sheet1', matched_df, False)])
     print("File Created Successfully.............")
 
 
@@ -0,0 +1,235 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import importlib
+import traceback
+import multiprocessing
+from contextlib import redirect_stdout
+from multiprocessing.connection import wait
+import pandas as pd
+from excel_output import write_results
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; jobs then run without a memory limit
+    resource = None
+
+# Script whose main() is run when a manifest entry does not name one
+DEFAULT_SCRIPT = 'newCode'
+
+# Scripts a manifest entry may name; their main() takes (business_file, query_file, primary_column, output_file)
+BATCH_SCRIPTS = ('newCode', 'newCode2', 'demo', 'demo2', 'demo3', 'demo4', 'demo5', 'demo7', 'Price_Compare_advanced',
+                 'streaming_compare')
+
+# Every manifest entry needs these
+REQUIRED_FIELDS = ('business_file', 'query_file', 'primary_column', 'output_file')
+
+SUMMARY_COLUMNS = ['Job', 'Script', 'Business File', 'System File', 'Primary Column', 'Status', 'Seconds',
+                   'Peak Memory MB', 'Message', 'Log File']
+
+
+def load_manifest(manifest_path):
+    """Function to read the list of jobs from a CSV, JSON or YAML manifest."""
+    extension = os.path.splitext(manifest_path)[1].lower()
+    with open(manifest_path, newline='', encoding='utf-8') as f:
+        if extension == '.csv':
+            jobs = list(csv.DictReader(f))
+        elif extension == '.json':
+            jobs = json.load(f)
+        elif extension in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("Reading a YAML manifest needs PyYAML (pip install pyyaml)")
+            jobs = yaml.safe_load(f)
+        else:
+            raise ValueError(f"Unknown manifest type {extension!r}, expected .csv, .json, .yaml or .yml")
+
+    # Allow {"jobs": [...]} as well as a bare list
+    if isinstance(jobs, dict):
+        jobs = jobs.get('jobs', [])
+    return [normalize_job(job, position) for position, job in enumerate(jobs, 1)]
+
+
+def normalize_job(job, position):
+    """Function to check one manifest entry and fill in its defaults."""
+    # Empty CSV cells mean "use the default"
+    job = {key.strip(): value for key, value in job.items() if key and value not in (None, '')}
+    missing = [field for field in REQUIRED_FIELDS if field not in job]
+    if missing:
+        raise ValueError(f"Manifest entry {position} is missing {', '.join(missing)}")
+    job.setdefault('name', str(job['output_file']))
+    job.setdefault('script', DEFAULT_SCRIPT)
+    # Only known scripts are imported, so a manifest cannot run any module on the path
+    if job['script'] not in BATCH_SCRIPTS:
+        raise ValueError(f"Manifest entry {position} names unknown script {job['script']!r}, "
+                         f"expected one of {', '.join(BATCH_SCRIPTS)}")
+    if 'memory_mb' in job:
+        job['memory_mb'] = int(job['memory_mb'])
+    return job
+
+
+def key_description(primary_column):
+    """Function to show a composite key (a list of columns in a JSON or YAML manifest) in one summary cell."""
+    return primary_column if isinstance(primary_column, str) else ' + '.join(primary_column)
+
+
+def limit_memory(memory_mb):
+    """Function to cap the address space of the current process, so a runaway job fails instead of the host.
+
+    RLIMIT_AS limits virtual address space, not resident memory: a job
+    reserves more than it ever touches (thread stacks, memory-mapped
+    libraries), so the limit must sit well above the peak memory in the
+    run summary. A job over the limit gets a MemoryError or is aborted.
+    """
+    if resource is None or not memory_mb:
+        return
+    limit = memory_mb * 1024 * 1024
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def peak_memory_mb():
+    """Function to read the peak resident memory of this process and its finished children, in MB."""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_job(job, log_dir):
+    """Function to run one reconciliation in this (fresh) worker process, logging its output to a file."""
+    log_path = os.path.join(log_dir, f"{job['name']}.log")
+    start = time.perf_counter()
+    status, message = 'Succeeded', ''
+    with open(log_path, 'w', encoding='utf-8') as log, redirect_stdout(log):
+        try:
+            limit_memory(job.get('memory_mb'))
+            script = importlib.import_module(job['script'])
+            script.main(job['business_file'], job['query_file'], job['primary_column'], job['output_file'])
+        except MemoryError:
+            status, message = 'Failed', f"Exceeded the {job.get('memory_mb')} MB memory limit"
+        except Exception as e:
+            traceback.print_exc(file=log)
+            status, message = 'Failed', str(e)
+
+    # The scripts report their own errors instead of raising
+    if status == 'Succeeded':
+        with open(log_path, encoding='utf-8') as log:
+            errors = [line.strip() for line in log if line.startswith('An error occurred')]
+        if errors:
+            status, message = 'Failed', errors[-1]
+            # A MemoryError caught by the script prints without any text
+            if message.endswith(':') and job.get('memory_mb'):
+                message = f"Exceeded the {job['memory_mb']} MB memory limit"
+
+    return {
+        'Job': job['name'],
+        'Script': job['script'],
+        'Business File': job['business_file'],
+        'System File': job['query_file'],
+        'Primary Column': key_description(job['primary_column']),
+        'Status': status,
+        'Seconds': round(time.perf_counter() - start, 2),
+        'Peak Memory MB': peak_memory_mb(),
+        'Message': message,
+        'Log File': log_path
+    }
+
+
+def run_job_process(job, log_dir, sender):
+    """Function to run one job in its own process and send its summary row back to the batch."""
+    sender.send(run_job(job, log_dir))
+    sender.close()
+
+
+def stopped_job_result(job, exitcode):
+    """Function to build the summary row of a job whose process died before reporting."""
+    return {'Job': job['name'], 'Script': job['script'], 'Business File': job['business_file'],
+            'System File': job['query_file'], 'Primary Column': key_description(job['primary_column']),
+            'Status': 'Failed', 'Seconds': None, 'Peak Memory MB': None,
+            'Message': f"Worker stopped with exit code {exitcode}" +
+                       (f", probably at its {job['memory_mb']} MB memory limit" if job.get('memory_mb') else ''),
+            'Log File': None}
+
+
+def run_batch(jobs, max_workers=None, memory_mb=None, log_dir='batch_logs'):
+    """Function to run all jobs, max_workers at a time, and return one summary row per job, in manifest order.
+
+    Every job gets its own process, so its memory is given back when it
+    ends, and a job aborted by its memory limit (or killed by the OS) only
+    fails itself.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    max_workers = max_workers or os.cpu_count() or 1
+    results = [None] * len(jobs)
+    # 'spawn' starts every job in a fresh interpreter and is the only option on Windows
+    context = multiprocessing.get_context('spawn')
+    pending = list(enumerate(jobs))
+    running = {}
+    while pending or running:
+        while pending and len(running) < max_workers:
+            position, job = pending.pop(0)
+            if memory_mb and 'memory_mb' not in job:
+                job = dict(job, memory_mb=memory_mb)
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=run_job_process, args=(job, log_dir, sender))
+            process.start()
+            sender.close()
+            running[receiver] = (position, job, process)
+
+        for receiver in wait(list(running)):
+            position, job, process = running.pop(receiver)
+            try:
+                results[position] = receiver.recv()
+            except EOFError:
+                # The process died before sending its summary row
+                results[position] = None
+            receiver.close()
+            process.join()
+            if results[position] is None:
+                results[position] = stopped_job_result(job, process.exitcode)
+            print(f"[{sum(result is not None for result in results)}/{len(jobs)}] {job['name']}: "
+                  f"{results[position]['Status']}")
+    return results
+
+
+def main(manifest_path, max_workers=None, memory_mb=None, summary_file='batch_run', log_dir='batch_logs'):
+    try:
+        jobs = load_manifest(manifest_path)
+        print(f"Running {len(jobs)} jobs from {manifest_path}")
+        start = time.perf_counter()
+        results = run_batch(jobs, max_workers, memory_mb, log_dir)
+
+        summary_df = pd.DataFrame(results, columns=SUMMARY_COLUMNS)
+        failed = int((summary_df['Status'] != 'Succeeded').sum())
+        print(f"{len(jobs) - failed} of {len(jobs)} jobs succeeded in {time.perf_counter() - start:.1f} seconds")
+
+        output_file_path = fr"D:\Work\Output_Sheets\{summary_file}_output.xlsx"
+        print(f"Saving run summary to {output_file_path}")
+        write_results(output_file_path, [('Run Summary', summary_df, False)])
+        print("File Created Successfully.............")
+        return summary_df
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile many business/system file pairs listed in a manifest.")
+    parser.add_argument('manifest', help="CSV, JSON or YAML file with business_file, query_file, primary_column, "
+                                         "output_file and optional name, script and memory_mb per job")
+    parser.add_argument('--workers', type=int, default=None, help="Jobs run at the same time (default: CPU count)")
+    parser.add_argument('--memory-mb', type=int, default=None, help="Memory limit per job unless the job sets one")
+    parser.add_argument('--summary', default='batch_run', help="Name of the run summary workbook")
+    parser.add_argument('--log-dir', default='batch_logs', help="Folder for the per-job logs")
+    args = parser.parse_args()
+    main(args.manifest, args.workers, args.memory_mb, args.summary, args.log_dir)
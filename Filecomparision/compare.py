@@ -0,0 +1,269 @@
+import os
+import sys
+import argparse
+import importlib
+
+# Only argparse is imported up front; pandas and the engine load inside the subcommand that needs them,
+# so --help and argument errors return immediately
+
+SUBCOMMANDS = ('run', 'stream', 'batch', 'serve', 'distribute', 'worker', 'remote', 'share')
+
+# Scripts with main(business_file, query_file, primary_column, output_file)
+RUN_SCRIPTS = ('newCode', 'newCode2', 'demo', 'demo2', 'demo3', 'demo4', 'demo5', 'demo7', 'Price_Compare_advanced')
+
+# Scripts whose main() also takes matched_format and split_mode
+FORMAT_SCRIPTS = ('newCode', 'newCode2', 'demo5', 'demo7')
+
+# Scripts whose main() can reuse the row statuses of an earlier run
+SNAPSHOT_SCRIPTS = ('newCode', 'demo7')
+
+# Scripts whose main() takes a per-column rules file
+RULES_SCRIPTS = ('newCode', 'newCode2', 'demo7', 'Price_Compare_advanced')
+
+# Scripts whose main() can put keys found on one side only in their own sheet and resolve duplicate keys
+ORPHAN_SCRIPTS = ('newCode', 'newCode2', 'demo7')
+
+# How rows sharing a key are merged, as in compare_engine.DUPLICATE_STRATEGIES
+DUPLICATE_STRATEGIES = ('keep', 'first', 'last', 'aggregate', 'ordinal')
+
+# Scripts whose main() takes a composite key (a list of primary columns)
+COMPOSITE_KEY_SCRIPTS = ('newCode', 'newCode2', 'demo7', 'Price_Compare_advanced')
+
+# stream --sorted values, as the presorted argument of streaming_compare.main
+SORTED_CHOICES = {'auto': None, 'yes': True, 'no': False}
+
+# Scripts whose main() returns its result, and None when it failed
+RESULT_SCRIPTS = ('newCode', 'newCode2', 'demo7')
+
+
+def default_output_name(business_file):
+    """Function to name the output after the business file when --output is not given."""
+    return os.path.splitext(os.path.basename(business_file))[0]
+
+
+def primary_key(keys):
+    """Function to pass one --key as a column name and several as a composite key."""
+    return keys[0] if len(keys) == 1 else keys
+
+
+def run_command(args):
+    """Function to reconcile one business/system pair with the chosen script."""
+    if args.script not in FORMAT_SCRIPTS and (args.format or args.split):
+        raise SystemExit(f"--format and --split are only supported by {', '.join(FORMAT_SCRIPTS)}")
+    if args.script not in SNAPSHOT_SCRIPTS and args.snapshot:
+        raise SystemExit(f"--snapshot is only supported by {', '.join(SNAPSHOT_SCRIPTS)}")
+    if args.script not in RULES_SCRIPTS and args.rules:
+        raise SystemExit(f"--rules is only supported by {', '.join(RULES_SCRIPTS)}")
+    if args.script not in ORPHAN_SCRIPTS and (args.orphans or args.duplicates):
+        raise SystemExit(f"--orphans and --duplicates are only supported by {', '.join(ORPHAN_SCRIPTS)}")
+    if args.script not in COMPOSITE_KEY_SCRIPTS and len(args.key) > 1:
+        raise SystemExit(f"A composite --key is only supported by {', '.join(COMPOSITE_KEY_SCRIPTS)}")
+    options = {}
+    if args.orphans:
+        options['orphan_sheet'] = True
+    if args.duplicates:
+        options['duplicate_strategy'] = args.duplicates
+    if args.workers:
+        options['workers'] = args.workers
+    if args.rules:
+        options['rules_file'] = args.rules
+    if args.snapshot:
+        options['snapshot_name'] = args.snapshot
+    if args.format:
+        options['matched_format'] = args.format
+    if args.split:
+        options['split_mode'] = args.split
+
+    script = importlib.import_module(args.script)
+    result = script.main(args.business, args.system, primary_key(args.key),
+                         args.output or default_output_name(args.business), **options)
+    return 1 if args.script in RESULT_SCRIPTS and result is None else 0
+
+
+def stream_command(args):
+    """Function to reconcile one pair bucket by bucket with bounded memory."""
+    import streaming_compare
+    streaming_compare.main(args.business, args.system, primary_key(args.key),
+                           args.output or default_output_name(args.business),
+                           memory_budget_mb=args.memory_mb, spill_dir=args.spill_dir, rules_file=args.rules,
+                           presorted=SORTED_CHOICES[args.sorted])
+    return 0
+
+
+def distribute_command(args):
+    """Function to reconcile one pair on several workers, each comparing part of the keys."""
+    import distributed_compare
+    result = distributed_compare.main(args.business, args.system, primary_key(args.key),
+                                      args.output or default_output_name(args.business),
+                                      workers=args.worker or args.local, rules_file=args.rules,
+                                      orphan_sheet=args.orphans, duplicate_strategy=args.duplicates or 'keep',
+                                      partitions=args.partitions, memory_budget_mb=args.memory_mb,
+                                      spill_dir=args.spill_dir)
+    return 1 if result is None else 0
+
+
+def worker_command(args):
+    """Function to start a worker that reconciles the key partitions sent by distribute."""
+    import distributed_compare
+    distributed_compare.serve_worker(args.host, args.port)
+    return 0
+
+
+def remote_command(args):
+    """Function to reconcile a local business file with a system file shared by another host."""
+    import merkle_compare
+    result = merkle_compare.main(args.business, primary_column=primary_key(args.key),
+                                 output_file=args.output or default_output_name(args.business),
+                                 system_address=args.system_at, rules_file=args.rules, orphan_sheet=args.orphans,
+                                 duplicate_strategy=args.duplicates or 'keep', rows_per_bucket=args.bucket_rows)
+    return 1 if result is None else 0
+
+
+def share_command(args):
+    """Function to share a system file with the hosts running remote, sending only the rows that differ."""
+    import merkle_compare
+    merkle_compare.serve_side(args.file, 0, args.host, args.port)
+    return 0
+
+
+def batch_command(args):
+    """Function to reconcile every pair listed in a manifest."""
+    import batch_runner
+    summary_df = batch_runner.main(args.manifest, args.workers, args.memory_mb, args.summary, args.log_dir)
+    return 1 if summary_df is None or (summary_df['Status'] != 'Succeeded').any() else 0
+
+
+def serve_command(args):
+    """Function to start the warm comparison service."""
+    import compare_service
+    compare_service.main(args.host, args.port, args.cache_sheets)
+    return 0
+
+
+def add_pair_arguments(parser):
+    """Function to add the business/system/key/output arguments shared by run and stream."""
+    parser.add_argument('--business', required=True, help="Business (source) workbook")
+    parser.add_argument('--system', required=True, help="System (target) extract")
+    parser.add_argument('--key', required=True, action='append',
+                        help="Primary column both files are matched on; repeat for a composite key")
+    parser.add_argument('--output', help="Output name, written as <output>_output.xlsx (default: business file name)")
+    parser.add_argument('--rules', help="JSON/YAML file of per-column comparison rules")
+
+
+def build_parser():
+    """Function to build the argument parser for every subcommand."""
+    parser = argparse.ArgumentParser(
+        prog='compare',
+        description="Reconcile business and system files. Without a subcommand the arguments are passed to 'run', "
+                    "e.g. compare --business a.xlsx --system b.xlsx --key Id")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Reconcile one pair in memory")
+    add_pair_arguments(run_parser)
+    run_parser.add_argument('--script', default='newCode', choices=RUN_SCRIPTS, help="Comparison to run")
+    run_parser.add_argument('--format', choices=('xlsx', 'csv', 'parquet'),
+                            help="Where to write Matched Data (default: inside the workbook)")
+    run_parser.add_argument('--split', choices=('sheets', 'workbooks'),
+                            help="How to split sheets over Excel's row limit (default: sheets)")
+    run_parser.add_argument('--snapshot', help="Name under which row statuses are kept, so the next run with the "
+                                               "same name only compares changed rows")
+    run_parser.add_argument('--orphans', action='store_true',
+                            help="List keys found in one file only on an Orphan Keys sheet and compare only "
+                                 "the shared keys")
+    run_parser.add_argument('--duplicates', choices=DUPLICATE_STRATEGIES,
+                            help="How rows sharing a key are merged (default: keep, refused when the merge would "
+                                 "be too large)")
+    run_parser.add_argument('--workers', type=int,
+                            help="Processes comparing the columns at the same time (default: compare in one process)")
+    run_parser.set_defaults(handler=run_command)
+
+    stream_parser = subparsers.add_parser('stream', help="Reconcile one pair in buckets, for files larger than memory")
+    add_pair_arguments(stream_parser)
+    stream_parser.add_argument('--memory-mb', type=int, default=1024, help="Memory one bucket pair may use")
+    stream_parser.add_argument('--spill-dir', help="Folder for the temporary bucket files")
+    stream_parser.add_argument('--sorted', choices=tuple(SORTED_CHOICES), default='auto',
+                               help="Whether both files are sorted on the key, so they can be read side by side "
+                                    "without spilling (default: auto, spill when they turn out not to be)")
+    stream_parser.set_defaults(handler=stream_command)
+
+    distribute_parser = subparsers.add_parser('distribute', help="Reconcile one pair on several workers, "
+                                                                 "split by key")
+    add_pair_arguments(distribute_parser)
+    distribute_parser.add_argument('--worker', action='append',
+                                   help="host:port of a running worker; repeat for every worker "
+                                        "(the key in RECONCILE_AUTHKEY must match theirs)")
+    distribute_parser.add_argument('--local', type=int, default=2,
+                                   help="Workers to start on this machine when no --worker is given (default: 2)")
+    distribute_parser.add_argument('--partitions', type=int,
+                                   help="Key partitions to split the files into (default: 4 per worker, more when "
+                                        "one partition would not fit --memory-mb)")
+    distribute_parser.add_argument('--memory-mb', type=int, default=1024,
+                                   help="Memory one partition pair may use on the coordinator and a worker")
+    distribute_parser.add_argument('--spill-dir', help="Folder for the temporary partition files")
+    distribute_parser.add_argument('--orphans', action='store_true',
+                                   help="List keys found in one file only on an Orphan Keys sheet")
+    distribute_parser.add_argument('--duplicates', choices=DUPLICATE_STRATEGIES,
+                                   help="How rows sharing a key are merged (default: keep)")
+    distribute_parser.set_defaults(handler=distribute_command)
+
+    worker_parser = subparsers.add_parser('worker', help="Reconcile the key partitions sent by distribute "
+                                                         "(needs RECONCILE_AUTHKEY)")
+    worker_parser.add_argument('--host', default='127.0.0.1',
+                               help="Address to listen on; use 0.0.0.0 to accept other hosts")
+    worker_parser.add_argument('--port', type=int, default=8770)
+    worker_parser.set_defaults(handler=worker_command)
+
+    remote_parser = subparsers.add_parser('remote', help="Reconcile a business file with a system file shared by "
+                                                         "another host, fetching only the rows that differ")
+    remote_parser.add_argument('--business', required=True, help="Business (source) workbook")
+    remote_parser.add_argument('--system-at', required=True,
+                               help="host:port of the share serving the system extract "
+                                    "(the key in RECONCILE_AUTHKEY must match its own)")
+    remote_parser.add_argument('--key', required=True, action='append',
+                               help="Primary column both files are matched on; repeat for a composite key")
+    remote_parser.add_argument('--output', help="Output name, written as <output>_output.xlsx "
+                                                "(default: business file name)")
+    remote_parser.add_argument('--rules', help="JSON/YAML file of per-column comparison rules")
+    remote_parser.add_argument('--orphans', action='store_true',
+                               help="List keys found in one file only on an Orphan Keys sheet")
+    remote_parser.add_argument('--duplicates', choices=DUPLICATE_STRATEGIES,
+                               help="How rows sharing a key are merged (default: keep)")
+    remote_parser.add_argument('--bucket-rows', type=int, default=64,
+                               help="Rows per key bucket; smaller buckets fetch fewer rows around each difference "
+                                    "but exchange more tree hashes (default: 64)")
+    remote_parser.set_defaults(handler=remote_command)
+
+    share_parser = subparsers.add_parser('share', help="Share a system file with remote (needs RECONCILE_AUTHKEY)")
+    share_parser.add_argument('file')
+    share_parser.add_argument('--host', default='127.0.0.1',
+                              help="Address to listen on; use 0.0.0.0 to accept other hosts")
+    share_parser.add_argument('--port', type=int, default=8771)
+    share_parser.set_defaults(handler=share_command)
+
+    batch_parser = subparsers.add_parser('batch', help="Reconcile every pair in a CSV/JSON/YAML manifest")
+    batch_parser.add_argument('manifest')
+    batch_parser.add_argument('--workers', type=int, help="Jobs run at the same time (default: CPU count)")
+    batch_parser.add_argument('--memory-mb', type=int, help="Memory limit per job unless the job sets one")
+    batch_parser.add_argument('--summary', default='batch_run', help="Name of the run summary workbook")
+    batch_parser.add_argument('--log-dir', default='batch_logs', help="Folder for the per-job logs")
+    batch_parser.set_defaults(handler=batch_command)
+
+    serve_parser = subparsers.add_parser('serve', help="Keep the engine loaded and take jobs over HTTP")
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--cache-sheets', type=int, default=16, help="Parsed sheets kept in memory")
+    serve_parser.set_defaults(handler=serve_command)
+    return parser
+
+
+def cli(argv=None):
+    """Function to parse the command line and run the chosen subcommand; returns the exit code."""
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv and argv[0] not in SUBCOMMANDS and argv[0] not in ('-h', '--help'):
+        argv = ['run'] + argv
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
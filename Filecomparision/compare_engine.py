@@ -0,0 +1,836 @@
+import os
+import json
+import pandas as pd
+import numpy as np
+from functools import lru_cache
+
+MATCHED = 'Matched'
+NOT_MATCHED = 'Not Matched'
+
+# Upper bound on distinct values remembered by a shared normalizer
+NORMALIZE_CACHE_SIZE = 200000
+
+# Comparison kinds a rules file may give a column, with the options each one takes
+RULE_KINDS = {
+    'text': (),                  # whitespace collapsed and case-insensitive (what every column gets by default)
+    'case_insensitive': (),      # case-insensitive, whitespace kept
+    'collapse_whitespace': (),   # whitespace collapsed, case kept
+    'exact': (),                 # str() values must be identical
+    'numeric': ('abs_tol', 'rel_tol'),
+    'decimal_places': ('places',),
+    'date': ('dayfirst',),
+    'ignore': (),                # not compared and given no Status column
+}
+
+# Rules applied unless a rules file overrides them
+DEFAULT_RULES = {'Net Price': {'kind': 'decimal_places', 'places': 0}}
+
+# How two missing cells (NaN, None, NaT, pd.NA) compare; a missing cell never matches a present one
+MISSING_POLICIES = ('match', 'mismatch')
+
+# Hash every missing cell gets in a row fingerprint, whatever its type
+MISSING_FINGERPRINT = np.uint64(0x9E3779B97F4A7C15)
+
+# Multiplier that folds the per-column hashes of a row into one fingerprint (64-bit FNV prime)
+FINGERPRINT_PRIME = np.uint64(1099511628211)
+
+# Comparison modes a status matrix can be built in (see status_kernels)
+STATUS_MODES = ('text', 'shadow', 'native')
+
+# How rows sharing a key on one side are handled before the merge:
+# keep pairs every business row with every system row of the key (what pd.merge does),
+# first/last keep one row per key, aggregate folds them into one row,
+# ordinal pairs the n-th business row of a key with its n-th system row
+DUPLICATE_STRATEGIES = ('keep', 'first', 'last', 'aggregate', 'ordinal')
+
+# With the keep strategy, a merge in which repeated keys would add more rows than this is refused
+MAX_DUPLICATE_MERGE_ROWS = 5000000
+
+# Position of a row among the rows sharing its key, added to both sides for the ordinal strategy
+ORDINAL_COLUMN = '__key_ordinal'
+
+# Shared int64 index of the (possibly composite) key, added to both sides by add_key_index
+KEY_INDEX_COLUMN = '__key_index'
+
+
+def get_base_columns(matched_df):
+    """Function to collect the base names of the columns that exist as both _Input and _Output."""
+    base_columns = set(col.rsplit('_', 1)[0] for col in matched_df.columns if '_' in col)
+    return [base_column for base_column in base_columns
+            if f'{base_column}_Input' in matched_df.columns and f'{base_column}_Output' in matched_df.columns]
+
+
+def make_normalizer(func, maxsize=NORMALIZE_CACHE_SIZE):
+    """Function to wrap a per-value normalizer in a bounded cache that all columns of a run share."""
+    return lru_cache(maxsize=maxsize)(func)
+
+
+def collapse_upper(text):
+    """Function to collapse whitespace and upper-case a text value."""
+    return ' '.join(text.split()).upper()
+
+
+def clean_text(text):
+    """Function to clean unwanted characters from text."""
+    if isinstance(text, str):
+        return text.replace('\r', '').replace('\n', '').strip()
+    return text
+
+
+def strip_upper(text):
+    """Function to strip and upper-case text."""
+    if isinstance(text, str):
+        return text.strip().upper()
+    return text
+
+
+def upper_text(text):
+    """Function to upper-case a text value."""
+    return text.upper()
+
+
+def collapse_whitespace(text):
+    """Function to collapse the whitespace of a text value."""
+    return ' '.join(text.split())
+
+
+def normalize_unique(series, normalizer):
+    """Function to run normalizer once per distinct text value of a column and map the results back."""
+    codes, uniques = pd.factorize(series)
+    uniques = np.asarray(uniques, dtype=object)
+    is_text = np.fromiter((isinstance(value, str) for value in uniques), dtype=bool, count=len(uniques))
+
+    normalized = np.empty(len(uniques), dtype=object)
+    normalized[is_text] = [normalizer(value) for value in uniques[is_text]]
+
+    # Only text cells are replaced, so numbers keep their exact type (1 vs 1.0 factorize together)
+    text_rows = codes >= 0
+    text_rows[text_rows] = is_text[codes[text_rows]]
+    values = np.asarray(series, dtype=object).copy()
+    values[text_rows] = normalized[codes[text_rows]]
+    return pd.Series(values, index=series.index, name=series.name)
+
+
+def normalize_frame_columns(df, columns, normalizer):
+    """Function to normalize the text in the given columns of df in place."""
+    for col in columns:
+        df[col] = normalize_text_column(df[col], normalizer)
+    return df
+
+
+def normalize_text_column(series, normalizer):
+    """Function to return a normalized copy of a text column; other columns are returned untouched."""
+    if series.dtype == object or pd.api.types.is_string_dtype(series):
+        return normalize_unique(series, normalizer)
+    return series
+
+
+def str_values(values):
+    """Function to str() every cell of a column into an object array of Python strings."""
+    # numpy's astype(str) would make a fixed-width array, every cell as wide as the longest one
+    return np.frompyfunc(str, 1, 1)(np.asarray(values, dtype=object)).astype(object)
+
+
+def normalize_column(series, normalizer=None):
+    """Vectorized form of ' '.join(str(value).split()).upper() for a whole column."""
+    if normalizer is None:
+        normalizer = make_normalizer(collapse_upper)
+    # str() every cell once (NaN -> 'nan', 1.0 -> '1.0') exactly like the row-wise lambda did
+    text = pd.Series(str_values(series), index=series.index, dtype=object)
+    return normalize_unique(text, normalizer)
+
+
+def column_fingerprints(series):
+    """Function to hash every cell of a column so that cells with equal hashes have equal str() values."""
+    values = np.asarray(series)
+    if values.dtype.kind in 'biufcmM':
+        # Raw bits salted with the dtype, so 0 and 0.0 (which print differently) get different hashes
+        salt = pd.util.hash_array(np.array([values.dtype.str], dtype=object))[0]
+        return pd.util.hash_array(values, categorize=False) ^ salt
+    # Text is hashed as is and mixed values through str(); every kind of missing value hashes alike
+    values = np.asarray(values, dtype=object)
+    hashes = pd.util.hash_array(values, categorize=False)
+    hashes[pd.isna(values)] = MISSING_FINGERPRINT
+    return hashes
+
+
+def row_fingerprints(df, columns):
+    """Function to fold the cell hashes of the given columns into one 64-bit fingerprint per row."""
+    fingerprints = np.zeros(len(df), dtype=np.uint64)
+    for col in columns:
+        fingerprints = fingerprints * FINGERPRINT_PRIME ^ column_fingerprints(df[col])
+    return fingerprints
+
+
+def dtype_family(series):
+    """Function to name the kind of values a column holds natively, or None for text and mixed (object) columns."""
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'bool'
+    if pd.api.types.is_numeric_dtype(dtype):
+        return 'numeric'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return f"datetime[{getattr(dtype, 'tz', None)}]"
+    if pd.api.types.is_timedelta64_dtype(dtype):
+        return 'timedelta'
+    return None
+
+
+def native_values(series):
+    """Function to return the values of a column with no missing cells as a typed numpy array."""
+    # Nullable Int64/Float64/boolean columns carry the numpy dtype of their values
+    numpy_dtype = getattr(series.dtype, 'numpy_dtype', None)
+    return series.to_numpy(dtype=numpy_dtype) if numpy_dtype is not None else series.to_numpy()
+
+
+def object_mismatches(business_values, system_values):
+    """Function to compare two columns value by value as Python objects."""
+    return np.asarray(business_values.to_numpy(dtype=object) != system_values.to_numpy(dtype=object), dtype=bool)
+
+
+def equality_kernel(object_kernel, missing_policy='match', typed=True):
+    """Function to build a null-aware comparison kernel around object_kernel.
+
+    Missing cells are found with isna on the native columns, so NaN, None,
+    NaT and pd.NA are all missing and never turn into 'nan' or ''. Two
+    missing cells compare by missing_policy; one missing cell is Not
+    Matched. When both columns hold the same native kind of values
+    (numeric, bool, datetime, timedelta) and typed is set, the present
+    cells are compared as typed arrays; the rest go to object_kernel.
+    """
+    if missing_policy not in MISSING_POLICIES:
+        raise ValueError(f"Unknown missing policy {missing_policy!r}, expected one of {MISSING_POLICIES}")
+
+    def kernel(business_values, system_values):
+        business_missing = business_values.isna().to_numpy()
+        system_missing = system_values.isna().to_numpy()
+        mismatches = business_missing != system_missing
+        if missing_policy == 'mismatch':
+            mismatches |= business_missing & system_missing
+
+        present = ~(business_missing | system_missing)
+        if not present.any():
+            return mismatches
+        if not present.all():
+            business_values, system_values = business_values[present], system_values[present]
+        family = dtype_family(business_values) if typed else None
+        if family is not None and family == dtype_family(system_values):
+            mismatches[present] = native_values(business_values) != native_values(system_values)
+        else:
+            mismatches[present] = object_kernel(business_values, system_values)
+        return mismatches
+    return kernel
+
+
+def compare_columns(business_values, system_values):
+    """Function to compare two normalized columns and return the boolean match array."""
+    return np.asarray(business_values, dtype=object) == np.asarray(system_values, dtype=object)
+
+
+def load_rules(rules_path):
+    """Function to read per-column comparison rules from a JSON or YAML file ({column: {'kind': ..., options}})."""
+    extension = os.path.splitext(rules_path)[1].lower()
+    with open(rules_path, encoding='utf-8') as f:
+        if extension == '.json':
+            rules = json.load(f)
+        elif extension in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("Reading a YAML rules file needs PyYAML (pip install pyyaml)")
+            rules = yaml.safe_load(f)
+        else:
+            raise ValueError(f"Unknown rules file type {extension!r}, expected .json, .yaml or .yml")
+    return {base_column: validate_rule(base_column, rule) for base_column, rule in (rules or {}).items()}
+
+
+def validate_rule(base_column, rule):
+    """Function to check one column rule; a bare string is shorthand for {'kind': string}."""
+    if isinstance(rule, str):
+        rule = {'kind': rule}
+    kind = rule.get('kind')
+    if kind not in RULE_KINDS:
+        raise ValueError(f"Rule for {base_column!r} has unknown kind {kind!r}, expected one of {list(RULE_KINDS)}")
+    unknown = set(rule) - {'kind'} - set(RULE_KINDS[kind])
+    if unknown:
+        raise ValueError(f"Rule for {base_column!r} ({kind}) does not take {', '.join(sorted(unknown))}")
+    if any(rule.get(option, 0) < 0 for option in ('abs_tol', 'rel_tol', 'places')):
+        raise ValueError(f"Rule for {base_column!r} has a negative tolerance or number of places")
+    return dict(rule)
+
+
+def merge_rules(rules=None):
+    """Function to lay the given rules over DEFAULT_RULES."""
+    return {**DEFAULT_RULES, **(rules or {})}
+
+
+def compared_base_columns(base_columns, rules=None):
+    """Function to drop the base columns whose rule says to ignore them."""
+    rules = rules or {}
+    return [base_column for base_column in base_columns if rules.get(base_column, {}).get('kind') != 'ignore']
+
+
+def round_rule_columns(matched_df, base_columns, rules=None):
+    """Function to round, in place, the numeric _Input/_Output columns that have a decimal_places rule."""
+    for base_column in base_columns:
+        rule = (rules or {}).get(base_column, {})
+        if rule.get('kind') != 'decimal_places':
+            continue
+        for col in (f'{base_column}_Input', f'{base_column}_Output'):
+            if pd.api.types.is_numeric_dtype(matched_df[col]):
+                matched_df[col] = matched_df[col].round(rule.get('places', 0))
+    return matched_df
+
+
+def text_kernel(normalizer):
+    """Function to build a kernel that compares str() values after normalizer."""
+    def kernel(business_values, system_values):
+        return ~compare_columns(normalize_column(business_values, normalizer),
+                                normalize_column(system_values, normalizer))
+    return kernel
+
+
+def exact_kernel(business_values, system_values):
+    """Function to compare the str() values of two columns as they are."""
+    return ~compare_columns(str_values(business_values), str_values(system_values))
+
+
+def parsed_kernel(parse, equal, fallback):
+    """Function to build a kernel that compares parsed values; cells that do not parse are compared by fallback."""
+    def kernel(business_values, system_values):
+        business_parsed, system_parsed = parse(business_values), parse(system_values)
+        business_missing, system_missing = pd.isna(business_parsed), pd.isna(system_parsed)
+        with np.errstate(invalid='ignore'):
+            mismatches = ~(equal(business_parsed, system_parsed) | (business_missing & system_missing))
+
+        # A value that is present but is not a number/date on either side is compared as text
+        unparsed = ((business_missing & business_values.notna().to_numpy())
+                    | (system_missing & system_values.notna().to_numpy()))
+        if unparsed.any():
+            mismatches[unparsed] = fallback(business_values[unparsed], system_values[unparsed])
+        return mismatches
+    return kernel
+
+
+def compile_rule(rule, fallback):
+    """Function to turn one validated rule into a vectorized kernel(business_values, system_values) -> mismatches."""
+    kind = rule['kind']
+    if kind == 'text':
+        return fallback
+    if kind == 'case_insensitive':
+        return equality_kernel(text_kernel(make_normalizer(upper_text)))
+    if kind == 'collapse_whitespace':
+        return equality_kernel(text_kernel(make_normalizer(collapse_whitespace)))
+    if kind == 'exact':
+        return equality_kernel(exact_kernel, typed=False)
+    if kind in ('numeric', 'decimal_places'):
+        abs_tol, rel_tol, places = rule.get('abs_tol', 0), rule.get('rel_tol', 0), rule.get('places')
+
+        def parse(values):
+            numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+            return numbers if places is None else np.round(numbers, places)
+
+        def equal(business_numbers, system_numbers):
+            tolerance = np.maximum(abs_tol, rel_tol * np.maximum(np.abs(business_numbers), np.abs(system_numbers)))
+            return (business_numbers == system_numbers) | (np.abs(business_numbers - system_numbers) <= tolerance)
+        return parsed_kernel(parse, equal, fallback)
+    if kind == 'date':
+        dayfirst = rule.get('dayfirst', False)
+
+        def parse(values):
+            return pd.to_datetime(values, errors='coerce', format='mixed', dayfirst=dayfirst).to_numpy()
+        return parsed_kernel(parse, np.equal, fallback)
+    return None  # ignore
+
+
+def compile_rules(rules, fallback):
+    """Function to compile every column rule once per run; fallback is the kernel for columns without one."""
+    return {base_column: compile_rule(rule, fallback) for base_column, rule in (rules or {}).items()}
+
+
+class StatusMatrix:
+    """Match status of every compared column, packed to one bit per cell (1 = Not Matched).
+
+    The status stays in this form while the comparison runs; it is only
+    expanded to 'Matched' / 'Not Matched' when the output frame is built.
+    """
+
+    def __init__(self, n_rows):
+        self.n_rows = n_rows
+        self.status_columns = []
+        self._bits = {}
+
+    def add_column(self, status_column, mismatches):
+        """Function to store the boolean mismatch array of one status column in packed form."""
+        self._bits[status_column] = np.packbits(np.asarray(mismatches, dtype=bool))
+        if status_column not in self.status_columns:
+            self.status_columns.append(status_column)
+
+    def add_packed_column(self, status_column, bits):
+        """Function to store one status column that is already packed (np.packbits of its mismatch array)."""
+        self._bits[status_column] = np.array(bits, dtype=np.uint8)
+        if status_column not in self.status_columns:
+            self.status_columns.append(status_column)
+
+    def column_mismatches(self, status_column):
+        """Function to return the boolean mismatch array of one status column."""
+        return np.unpackbits(self._bits[status_column], count=self.n_rows).astype(bool)
+
+    def column_error_count(self, status_column):
+        """Function to count the Not Matched cells of one status column."""
+        return int(np.unpackbits(self._bits[status_column], count=self.n_rows).sum())
+
+    def row_mismatches(self, row):
+        """Function to list the status columns that are Not Matched in the row at the given position."""
+        byte, bit = divmod(row, 8)
+        return [col for col in self.status_columns if (self._bits[col][byte] >> (7 - bit)) & 1]
+
+    def row_error_counts(self):
+        """Function to count the Not Matched cells of every row."""
+        counts = np.zeros(self.n_rows, dtype=np.int64)
+        for status_column in self.status_columns:
+            counts += self.column_mismatches(status_column)
+        return counts
+
+    def mismatch_rows(self):
+        """Function to return the positions of the rows with at least one Not Matched cell."""
+        any_bits = np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+        for status_column in self.status_columns:
+            any_bits |= self._bits[status_column]
+        return np.flatnonzero(np.unpackbits(any_bits, count=self.n_rows))
+
+    def mismatch_matrix(self, rows=None):
+        """Function to expand the given rows (all by default) to a rows x columns boolean matrix."""
+        n_rows = self.n_rows if rows is None else len(rows)
+        matrix = np.zeros((n_rows, len(self.status_columns)), dtype=bool)
+        for position, status_column in enumerate(self.status_columns):
+            mismatches = self.column_mismatches(status_column)
+            matrix[:, position] = mismatches if rows is None else mismatches[rows]
+        return matrix
+
+    def expand(self, status_column):
+        """Function to expand one status column to 'Matched' / 'Not Matched' (stored as a 1-byte categorical)."""
+        return pd.Categorical.from_codes(self.column_mismatches(status_column).astype(np.int8),
+                                         categories=[MATCHED, NOT_MATCHED])
+
+    def expand_all(self):
+        """Function to expand every status column, keyed by status column name."""
+        return {status_column: self.expand(status_column) for status_column in self.status_columns}
+
+
+def missing_never_matches(kernel):
+    """Function to wrap a kernel so two missing cells are Not Matched."""
+    def wrapped(business_values, system_values):
+        return kernel(business_values, system_values) | (business_values.isna().to_numpy()
+                                                         & system_values.isna().to_numpy())
+    return wrapped
+
+
+def status_kernels(mode='text', rules=None, fill_missing=True):
+    """Function to build the default kernel and the compiled rule kernels of one comparison mode.
+
+    text compares whitespace-collapsed, upper-cased str() values
+    (build_status_matrix), shadow compares stripped, upper-cased values
+    with fill_missing deciding whether two missing cells match
+    (build_shadow_status_matrix) and native compares the values as they are
+    (build_native_status_matrix).
+    """
+    if mode not in STATUS_MODES:
+        raise ValueError(f"Unknown comparison mode {mode!r}, expected one of {STATUS_MODES}")
+    # One cache for both sides, so a value seen in _Input is not normalized again for _Output
+    text_default = equality_kernel(text_kernel(make_normalizer(collapse_upper)))
+    if mode == 'text':
+        return text_default, compile_rules(rules, text_default)
+    if mode == 'native':
+        native_default = equality_kernel(object_mismatches)
+        return native_default, compile_rules(rules, native_default)
+    normalizer = make_normalizer(strip_upper)
+
+    def normalized_mismatches(business_values, system_values):
+        # Only this pair is normalized, and only for as long as it is being compared
+        return object_mismatches(normalize_text_column(business_values, normalizer),
+                                 normalize_text_column(system_values, normalizer))
+
+    kernels = compile_rules(rules, text_default)
+    if not fill_missing:
+        # Two missing cells never match in this mode, whatever the column's rule says
+        kernels = {base_column: kernel and missing_never_matches(kernel) for base_column, kernel in kernels.items()}
+    return equality_kernel(normalized_mismatches, 'match' if fill_missing else 'mismatch'), kernels
+
+
+def build_status_matrix(matched_df, base_columns, rules=None):
+    """Function to compute the status of every compared column with whole-column operations."""
+    base_columns = compared_base_columns(base_columns, rules)
+    status_matrix = StatusMatrix(len(matched_df))
+    # Rows whose _Input and _Output values are identical are Matched in every column; only the rest are compared
+    differing = np.flatnonzero(
+        row_fingerprints(matched_df, [f'{base_column}_Input' for base_column in base_columns])
+        != row_fingerprints(matched_df, [f'{base_column}_Output' for base_column in base_columns]))
+    all_differ = len(differing) == len(matched_df)
+
+    default_kernel, kernels = status_kernels('text', rules)
+    for base_column in base_columns:
+        business_values = matched_df[f'{base_column}_Input']
+        system_values = matched_df[f'{base_column}_Output']
+        if not all_differ:
+            business_values = business_values.take(differing)
+            system_values = system_values.take(differing)
+
+        mismatches = np.zeros(len(matched_df), dtype=bool)
+        mismatches[differing] = kernels.get(base_column, default_kernel)(business_values, system_values)
+        status_matrix.add_column(f'{base_column}_Status', mismatches)
+    return status_matrix
+
+
+def build_shadow_status_matrix(matched_df, base_columns, fill_missing=True, rules=None):
+    """Function to compare strip/upper-normalized values of the compared columns without copying the frame.
+
+    Two missing cells match when fill_missing is set. Columns with a rule
+    are compared by the rule's kernel instead.
+    """
+    status_matrix = StatusMatrix(len(matched_df))
+    default_kernel, kernels = status_kernels('shadow', rules, fill_missing)
+    for base_column in compared_base_columns(base_columns, rules):
+        kernel = kernels.get(base_column, default_kernel)
+        status_matrix.add_column(f'{base_column}_Status',
+                                 kernel(matched_df[f'{base_column}_Input'], matched_df[f'{base_column}_Output']))
+    return status_matrix
+
+
+def build_native_status_matrix(matched_df, base_columns, rules=None):
+    """Function to compare the values of the compared columns as they are, two missing cells matching."""
+    status_matrix = StatusMatrix(len(matched_df))
+    default_kernel, kernels = status_kernels('native', rules)
+    for base_column in compared_base_columns(base_columns, rules):
+        kernel = kernels.get(base_column, default_kernel)
+        status_matrix.add_column(f'{base_column}_Status',
+                                 kernel(matched_df[f'{base_column}_Input'], matched_df[f'{base_column}_Output']))
+    return status_matrix
+
+
+def plan_column_layout(columns, status_columns, trailing_columns=()):
+    """Function to plan the output column order once: untouched columns, Input/Output/Status triples, trailing."""
+    paired_columns = []
+    for status_column in status_columns:
+        base_column = status_column[:-len('_Status')]
+        paired_columns.extend([f'{base_column}_Input', f'{base_column}_Output', status_column])
+    paired_set = set(paired_columns) | set(trailing_columns)
+    return [col for col in columns if col not in paired_set] + paired_columns + list(trailing_columns)
+
+
+def assemble_output_frame(matched_df, new_columns, layout):
+    """Function to materialize the planned layout in one copy instead of reindexing per column."""
+    data = {col: new_columns[col] if col in new_columns else matched_df[col] for col in layout}
+    return pd.DataFrame(data, index=matched_df.index, columns=layout)
+
+
+def key_columns(primary_column):
+    """Function to list the key columns; primary_column is one column name or a list of them for a composite key."""
+    if isinstance(primary_column, str):
+        return [primary_column]
+    return list(primary_column)
+
+
+def key_values(df, primary_column, suffix=''):
+    """Function to select the key of every row: a Series for a one-column key, a frame for a composite key."""
+    columns = [f'{column}{suffix}' for column in key_columns(primary_column)]
+    return df[columns[0]] if len(columns) == 1 else df[columns]
+
+
+def key_codes(input_df, query_df, primary_column):
+    """Function to hash the key of every row of both sides into a shared int64 key index.
+
+    Equal codes mean the merge pairs the rows. The index is dense (0 to
+    n_keys - 1) and exact, so composite keys never collide. Frames that
+    already carry KEY_INDEX_COLUMN (see add_key_index) are not hashed again.
+    Returns the codes of both sides and the number of distinct keys.
+    """
+    if KEY_INDEX_COLUMN in input_df.columns and KEY_INDEX_COLUMN in query_df.columns:
+        input_codes = input_df[KEY_INDEX_COLUMN].to_numpy()
+        query_codes = query_df[KEY_INDEX_COLUMN].to_numpy()
+        n_keys = int(max(input_codes.max(initial=-1), query_codes.max(initial=-1))) + 1
+        return input_codes, query_codes, n_keys
+
+    codes, n_keys = None, 0
+    for column in key_columns(primary_column):
+        # Missing keys get a code of their own, as the merge pairs them with each other too
+        column_codes, uniques = pd.factorize(pd.concat([input_df[column], query_df[column]], ignore_index=True),
+                                             use_na_sentinel=False)
+        if codes is None:
+            codes, n_keys = column_codes, len(uniques)
+        else:
+            # Fold the next column in and re-factorize, so the index stays dense and cannot overflow
+            codes, combined = pd.factorize(codes.astype(np.int64) * len(uniques) + column_codes)
+            n_keys = len(combined)
+    codes = codes.astype(np.int64)
+    return codes[:len(input_df)], codes[len(input_df):], n_keys
+
+
+def add_key_index(input_df, query_df, primary_column):
+    """Function to hash the key of both sides once and keep it in KEY_INDEX_COLUMN of both frames, in place.
+
+    The duplicate and orphan passes and the merge of a composite key then
+    work on this one int64 column instead of the key columns.
+    """
+    input_codes, query_codes, n_keys = key_codes(input_df, query_df, primary_column)
+    input_df[KEY_INDEX_COLUMN] = input_codes
+    query_df[KEY_INDEX_COLUMN] = query_codes
+    return n_keys
+
+
+def merge_on_key(input_df, query_df, primary_column):
+    """Function to outer-merge the business and system frames on the primary column (or columns)."""
+    columns = key_columns(primary_column)
+    if len(columns) > 1 and not (KEY_INDEX_COLUMN in input_df.columns and KEY_INDEX_COLUMN in query_df.columns):
+        input_codes, query_codes, _ = key_codes(input_df, query_df, primary_column)
+        input_df = input_df.assign(**{KEY_INDEX_COLUMN: input_codes})
+        query_df = query_df.assign(**{KEY_INDEX_COLUMN: query_codes})
+
+    # Rename the primary column in both dataframes
+    input_df = input_df.rename(columns={column: column + '_Input' for column in columns})
+    query_df = query_df.rename(columns={column: column + '_Output' for column in columns})
+
+    # The n-th business row of a key pairs with the n-th system row of that key
+    ordinal = [ORDINAL_COLUMN] if ORDINAL_COLUMN in input_df.columns and ORDINAL_COLUMN in query_df.columns else []
+    if len(columns) > 1:
+        # A composite key is joined on its int64 key index instead of several object columns
+        matched_df = pd.merge(input_df, query_df, on=[KEY_INDEX_COLUMN] + ordinal, how='outer',
+                              suffixes=('_Input', '_Output'))
+    else:
+        matched_df = pd.merge(input_df, query_df,
+                              left_on=[primary_column + '_Input'] + ordinal,
+                              right_on=[primary_column + '_Output'] + ordinal,
+                              how='outer',
+                              suffixes=('_Input', '_Output'))
+
+    # Drop the helper columns in place rather than copying the merged frame
+    for col in (KEY_INDEX_COLUMN, f'{KEY_INDEX_COLUMN}_Input', f'{KEY_INDEX_COLUMN}_Output', ORDINAL_COLUMN):
+        if col in matched_df.columns:
+            del matched_df[col]
+    return matched_df
+
+
+def key_label(df, primary_column):
+    """Function to describe the key of the first row of df for messages, e.g. 5 or ('EU', 5)."""
+    values = tuple(df[key_columns(primary_column)].iloc[0])
+    return values[0] if len(values) == 1 else values
+
+
+def split_orphan_keys(input_df, query_df, primary_column):
+    """Function to set aside the rows whose key is on one side only, before the merge.
+
+    Returns the business and system rows whose key is on both sides, and an
+    Orphan Keys frame (key columns, side, row number) of the rest.
+    """
+    input_codes, query_codes, n_keys = key_codes(input_df, query_df, primary_column)
+    in_input = np.zeros(n_keys, dtype=bool)
+    in_input[input_codes] = True
+    in_query = np.zeros(n_keys, dtype=bool)
+    in_query[query_codes] = True
+    input_shared = in_query[input_codes]
+    query_shared = in_input[query_codes]
+
+    orphan_frames = []
+    for side, df, shared in (('Business', input_df, input_shared), ('System', query_df, query_shared)):
+        orphans = np.flatnonzero(~shared)
+        orphan_data = {column: df[column].iloc[orphans].to_numpy() for column in key_columns(primary_column)}
+        orphan_data['Found Only In'] = side
+        orphan_data['Row Number'] = np.asarray(df.index[orphans]) + 1  # Row numbers in Excel are 1-based
+        orphan_frames.append(pd.DataFrame(orphan_data))
+    orphan_df = pd.concat(orphan_frames, ignore_index=True)
+    print(f"{int(input_shared.sum())} business and {int(query_shared.sum())} system rows share a key; "
+          f"{int((~input_shared).sum())} business-only and {int((~query_shared).sum())} system-only rows")
+
+    # Only copy a side when some of its rows are set aside
+    if not input_shared.all():
+        input_df = input_df.take(np.flatnonzero(input_shared))
+    if not query_shared.all():
+        query_df = query_df.take(np.flatnonzero(query_shared))
+    return input_df, query_df, orphan_df
+
+
+def profile_duplicate_keys(input_df, query_df, primary_column):
+    """Function to count the rows of every key on both sides and estimate how many rows the outer merge makes.
+
+    Returns a Duplicate Keys frame (key columns, business rows, system rows,
+    merged rows) of the keys repeated on either side, largest first, and
+    the estimated row count of the whole merge.
+    """
+    input_codes, query_codes, n_keys = key_codes(input_df, query_df, primary_column)
+    input_counts = np.bincount(input_codes, minlength=n_keys).astype(np.int64)
+    query_counts = np.bincount(query_codes, minlength=n_keys).astype(np.int64)
+    # A key on both sides makes every pairing of its rows, a key on one side keeps its rows
+    merged_counts = np.where((input_counts > 0) & (query_counts > 0), input_counts * query_counts,
+                             input_counts + query_counts)
+
+    duplicated = np.flatnonzero((input_counts > 1) | (query_counts > 1))
+    # The key values of a code are read from its first row on either side
+    codes = np.concatenate([input_codes, query_codes])
+    first_rows = np.zeros(n_keys, dtype=np.int64)
+    present, first_positions = np.unique(codes, return_index=True)
+    first_rows[present] = first_positions
+    columns = key_columns(primary_column)
+    keys = pd.concat([input_df[columns], query_df[columns]], ignore_index=True).iloc[first_rows[duplicated]]
+
+    duplicate_data = {column: keys[column].to_numpy() for column in columns}
+    duplicate_data['Business Rows'] = input_counts[duplicated]
+    duplicate_data['System Rows'] = query_counts[duplicated]
+    duplicate_data['Merged Rows'] = merged_counts[duplicated]
+    duplicate_df = pd.DataFrame(duplicate_data).sort_values('Merged Rows', ascending=False, kind='stable',
+                                                            ignore_index=True)
+    return duplicate_df, int(merged_counts.sum())
+
+
+def join_distinct(values):
+    """Function to fold the values of one column over the rows of a key: the value if they agree, else all of them."""
+    values = pd.unique(values.dropna())
+    if len(values) == 0:
+        return np.nan
+    if len(values) == 1:
+        return values[0]
+    return ' | '.join(str(value) for value in values)
+
+
+def aggregate_duplicate_rows(df, primary_column):
+    """Function to fold the rows sharing a key into one row, kept at the position of the first of them."""
+    columns = key_columns(primary_column)
+    repeated = df.duplicated(subset=columns, keep=False).to_numpy()
+    if not repeated.any():
+        return df
+    groups = df[repeated].groupby(columns, dropna=False, sort=False)
+    aggregated = groups.agg(join_distinct).reset_index()
+    # Groups come out in order of first appearance, like the rows drop_duplicates keeps
+    aggregated.index = df.index[repeated & ~df.duplicated(subset=columns, keep='first').to_numpy()]
+    return pd.concat([df[~repeated], aggregated[df.columns]]).sort_index(kind='stable')
+
+
+def resolve_duplicate_keys(input_df, query_df, primary_column, strategy='keep',
+                           max_duplicate_rows=MAX_DUPLICATE_MERGE_ROWS):
+    """Function to profile the duplicate keys of both sides and bound the merge by the chosen strategy.
+
+    Returns the business and system frames to merge and the Duplicate Keys
+    frame. With the keep strategy, a merge in which pairing the rows of
+    repeated keys adds more than max_duplicate_rows rows (beyond one row
+    per row of the larger side of each key) raises ValueError instead of
+    running out of memory; large extracts without many-to-many keys merge
+    as before.
+    """
+    if strategy not in DUPLICATE_STRATEGIES:
+        raise ValueError(f"Unknown duplicate strategy {strategy!r}, expected one of {DUPLICATE_STRATEGIES}")
+    duplicate_df, merged_rows = profile_duplicate_keys(input_df, query_df, primary_column)
+    if duplicate_df.empty:
+        return input_df, query_df, duplicate_df
+
+    print(f"{len(duplicate_df)} keys repeat ({int(duplicate_df['Business Rows'].sum())} business and "
+          f"{int(duplicate_df['System Rows'].sum())} system rows); the merge would make {merged_rows} rows")
+    if strategy == 'keep':
+        # Rows the cartesian pairing of repeated keys adds over keeping one row per row of the larger side
+        duplicate_rows = int((duplicate_df['Merged Rows'] -
+                              np.maximum(duplicate_df['Business Rows'], duplicate_df['System Rows'])).sum())
+        if max_duplicate_rows is not None and duplicate_rows > max_duplicate_rows:
+            raise ValueError(f"Merging on {', '.join(key_columns(primary_column))} would make {merged_rows} rows, "
+                             f"{duplicate_rows} of them from pairing the rows of repeated keys (more than "
+                             f"{max_duplicate_rows}); key {key_label(duplicate_df, primary_column)!r} alone "
+                             f"makes {duplicate_df['Merged Rows'].iloc[0]}. Use the first, last, aggregate or "
+                             f"ordinal duplicate strategy")
+        return input_df, query_df, duplicate_df
+
+    # With a key index the rows of a key are found on the one int64 column
+    columns = ([KEY_INDEX_COLUMN] if KEY_INDEX_COLUMN in input_df.columns and KEY_INDEX_COLUMN in query_df.columns
+               else key_columns(primary_column))
+    print(f"Resolving duplicate keys with the {strategy} strategy")
+    if strategy in ('first', 'last'):
+        input_df = input_df.drop_duplicates(subset=columns, keep=strategy)
+        query_df = query_df.drop_duplicates(subset=columns, keep=strategy)
+    elif strategy == 'aggregate':
+        input_df = aggregate_duplicate_rows(input_df, columns)
+        query_df = aggregate_duplicate_rows(query_df, columns)
+    else:
+        input_df = input_df.assign(**{ORDINAL_COLUMN: input_df.groupby(columns, dropna=False).cumcount()})
+        query_df = query_df.assign(**{ORDINAL_COLUMN: query_df.groupby(columns, dropna=False).cumcount()})
+    return input_df, query_df, duplicate_df
+
+
+def reconcile_frames(input_df, query_df, primary_column, clean_func=clean_text, base_columns=None,
+                     status_builder=build_status_matrix, rules=None):
+    """Function to merge one business/system pair and return the laid-out output frame and its status matrix.
+
+    status_builder(matched_df, base_columns, rules) computes the status
+    matrix of the normalized merge; build_status_matrix compares every row.
+    rules are laid over DEFAULT_RULES.
+    """
+    matched_df = merge_on_key(input_df, query_df, primary_column)
+
+    # Normalize string columns
+    str_cols = [col for col in matched_df.columns if col.endswith('_Input') or col.endswith('_Output')]
+    normalize_frame_columns(matched_df, str_cols, make_normalizer(clean_func))
+
+    if base_columns is None:
+        base_columns = get_base_columns(matched_df)
+    rules = merge_rules(rules)
+    base_columns = compared_base_columns(base_columns, rules)
+
+    # Columns compared to a number of decimal places are also shown rounded
+    round_rule_columns(matched_df, base_columns, rules)
+
+    # Check for "Matched" status, one whole column at a time
+    status_matrix = status_builder(matched_df, base_columns, rules)
+
+    # Adding Pass/Fail Column and the count of 'Not Matched' cells per row
+    output_columns = status_matrix.expand_all()
+    output_columns['Result'], output_columns['Not Matched Count'] = summarize_rows(status_matrix)
+
+    # Lay out key, Input/Output/Status triples, Result and Not Matched Count in a single copy
+    layout = plan_column_layout(matched_df.columns, status_matrix.status_columns, ['Result', 'Not Matched Count'])
+    return assemble_output_frame(matched_df, output_columns, layout), status_matrix
+
+
+def summarize_rows(status_matrix):
+    """Function to derive the Result and Not Matched Count columns from the status matrix."""
+    not_matched_count = status_matrix.row_error_counts()
+    return np.where(not_matched_count > 0, 'Fail', 'Pass'), not_matched_count
+
+
+def build_summary_frame(status_matrix, total_count):
+    """Function to build the per-column Summary Data frame with column reductions."""
+    summary_data = []
+    for status_column in status_matrix.status_columns:
+        error_count = status_matrix.column_error_count(status_column)
+        matched_count = status_matrix.n_rows - error_count
+        error_percentage = (error_count * 100.0) / total_count if total_count > 0 else 0
+        summary_data.append({
+            'Column': status_column,
+            'Total Matched': matched_count,
+            'Error': error_count,
+            'Percent Error': f"{error_percentage:.2f}%"
+        })
+    return pd.DataFrame(summary_data, columns=['Column', 'Total Matched', 'Error', 'Percent Error']).set_index('Column')
+
+
+def mismatch_labels(mismatch_matrix, column_names):
+    """Function to join the mismatched column names of every row, once per distinct mismatch pattern."""
+    if len(mismatch_matrix) == 0:
+        return np.empty(0, dtype=object)
+    column_names = np.asarray(column_names, dtype=object)
+    patterns, inverse = np.unique(np.packbits(mismatch_matrix, axis=1), axis=0, return_inverse=True)
+    labels = np.array([', '.join(column_names[np.unpackbits(pattern, count=len(column_names)).astype(bool)])
+                       for pattern in patterns], dtype=object)
+    return labels[inverse.reshape(-1)]
+
+
+def build_mismatch_frame(status_matrix, key_values, key_label='Id_Input'):
+    """Function to build the Mismatch Data frame (row number, key, mismatched columns) without iterrows.
+
+    key_values is a Series shown under key_label, or for a composite key a
+    frame whose columns are shown under their own names.
+    """
+    rows = status_matrix.mismatch_rows()
+    column_names = [col.replace('_Status', '') for col in status_matrix.status_columns]
+    mismatch_data = {'Row Number': np.asarray(key_values.index[rows]) + 1}  # Row numbers in Excel are 1-based
+    if isinstance(key_values, pd.DataFrame):
+        for col in key_values.columns:
+            mismatch_data[col] = key_values[col].iloc[rows].to_numpy()
+    else:
+        mismatch_data[key_label] = key_values.iloc[rows].to_numpy()
+    mismatch_data['Not Matched Columns'] = mismatch_labels(status_matrix.mismatch_matrix(rows), column_names)
+    return pd.DataFrame(mismatch_data)
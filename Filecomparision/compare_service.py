@@ -0,0 +1,150 @@
+import io
+import json
+import time
+import argparse
+import importlib
+import urllib.error
+import urllib.request
+from contextlib import redirect_stdout
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import ingest
+
+# Scripts the service runs; their main() returns the written paths and the summary frame
+SERVICE_SCRIPTS = ('newCode', 'newCode2', 'demo7')
+
+DEFAULT_SCRIPT = 'newCode'
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Parsed sheets kept in memory between jobs
+MEMORY_CACHE_SHEETS = 16
+
+REQUIRED_FIELDS = ('business_file', 'query_file', 'primary_column', 'output_file')
+
+# Optional main() parameters a job may pass
+OPTIONAL_FIELDS = ('matched_format', 'split_mode', 'snapshot_name', 'rules_file', 'orphan_sheet',
+                   'duplicate_strategy', 'workers')
+
+# Scripts whose main() can reuse the row statuses of an earlier run, as in compare.SNAPSHOT_SCRIPTS
+SNAPSHOT_SCRIPTS = ('newCode', 'demo7')
+
+
+def load_scripts():
+    """Function to import every service script once, so pandas, numpy and openpyxl are loaded before any job."""
+    return {name: importlib.import_module(name) for name in SERVICE_SCRIPTS}
+
+
+def run_compare(scripts, job):
+    """Function to run one job with the warm scripts and return (HTTP status, response body)."""
+    missing = [field for field in REQUIRED_FIELDS if field not in job]
+    if missing:
+        return 400, {'status': 'error', 'message': f"Missing {', '.join(missing)}"}
+    script = job.get('script', DEFAULT_SCRIPT)
+    if script not in scripts:
+        return 400, {'status': 'error', 'message': f"Unknown script {script!r}, expected one of {SERVICE_SCRIPTS}"}
+    unknown = [field for field in job if field not in REQUIRED_FIELDS + OPTIONAL_FIELDS + ('script',)]
+    if unknown:
+        return 400, {'status': 'error', 'message': f"Unknown {', '.join(map(str, unknown))}"}
+    # Checked here so a job the script cannot take is a bad request, not a TypeError from main()
+    if 'snapshot_name' in job and script not in SNAPSHOT_SCRIPTS:
+        return 400, {'status': 'error', 'message': f"snapshot_name is only supported by {', '.join(SNAPSHOT_SCRIPTS)}"}
+
+    start = time.perf_counter()
+    log = io.StringIO()
+    with redirect_stdout(log):
+        result = scripts[script].main(*(job[field] for field in REQUIRED_FIELDS),
+                                      **{field: job[field] for field in OPTIONAL_FIELDS if field in job})
+    seconds = round(time.perf_counter() - start, 3)
+
+    if result is None:
+        # The scripts print their error instead of raising it
+        errors = [line for line in log.getvalue().splitlines() if line.startswith('An error occurred')]
+        return 500, {'status': 'error', 'message': errors[-1] if errors else 'No result', 'seconds': seconds,
+                     'log': log.getvalue()}
+
+    written_paths, summary_df = result
+    return 200, {'status': 'ok', 'output_paths': written_paths,
+                 'summary': json.loads(summary_df.reset_index().to_json(orient='records')),
+                 'seconds': seconds, 'log': log.getvalue()}
+
+
+class CompareRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end: POST /compare runs a job, GET /health reports the service state."""
+
+    scripts = {}
+
+    def send_json(self, status, body):
+        """Function to send a JSON response."""
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_json(404, {'status': 'error', 'message': f"Unknown path {self.path}"})
+            return
+        self.send_json(200, {'status': 'ok', 'scripts': list(self.scripts), 'cache': ingest.memory_cache_info()})
+
+    def do_POST(self):
+        if self.path != '/compare':
+            self.send_json(404, {'status': 'error', 'message': f"Unknown path {self.path}"})
+            return
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError as e:
+            self.send_json(400, {'status': 'error', 'message': f"Invalid JSON: {e}"})
+            return
+        if not isinstance(job, dict):
+            self.send_json(400, {'status': 'error', 'message': "Expected a JSON object"})
+            return
+
+        try:
+            status, body = run_compare(self.scripts, job)
+        except Exception as e:
+            status, body = 500, {'status': 'error', 'message': str(e)}
+        print(f"{job.get('output_file')}: {body['status']} in {body.get('seconds', 0)} seconds")
+        self.send_json(status, body)
+
+
+def submit_job(job, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None):
+    """Function to send a job (the keyword arguments of main() as a dict) to a running service and return its reply."""
+    request = urllib.request.Request(f"http://{host}:{port}/compare", data=json.dumps(job).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read())
+
+
+def main(host=DEFAULT_HOST, port=DEFAULT_PORT, cache_sheets=MEMORY_CACHE_SHEETS):
+    """Serve comparison jobs until interrupted.
+
+    Jobs are handled one at a time, because the scripts report progress
+    through print and that output is captured per job.
+    """
+    print("Loading comparison engine")
+    CompareRequestHandler.scripts = load_scripts()
+    ingest.set_memory_cache_size(cache_sheets)
+    server = HTTPServer((host, port), CompareRequestHandler)
+    print(f"Comparison service listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping comparison service")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the comparison engine loaded and run jobs sent over HTTP.")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--cache-sheets', type=int, default=MEMORY_CACHE_SHEETS,
+                        help="Parsed sheets kept in memory between jobs")
+    args = parser.parse_args()
+    main(args.host, args.port, args.cache_sheets)
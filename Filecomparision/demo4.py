@@ -1,11 +1,15 @@
 import pandas as pd
-import numpy as np
-from copy import deepcopy
+from compare_engine import (merge_rules, get_base_columns, build_shadow_status_matrix, plan_column_layout,
+                            assemble_output_frame, summarize_rows)
+from parallel_status import build_parallel_status_matrix
+from ingest import read_excel_parallel
+from excel_output import write_results
 
 
-def main(business_file, query_file, primary_column, output_file):
-    input_df = pd.read_excel(business_file, sheet_name='Sheet1')
-    query_df = pd.read_excel(query_file)  # Query DF nothing but the system extract data
+def main(business_file, query_file, primary_column, output_file, workers=None):
+    # Both files are parsed at the same time in separate processes
+    # Query DF nothing but the system extract data
+    input_df, query_df = read_excel_parallel([(business_file, 'Sheet1'), (query_file, 0)])
 
     input_df = input_df.rename(columns={primary_column: primary_column + '_Input'})
     query_df = query_df.rename(columns={primary_column: primary_column + '_Output'})
@@ -15,63 +19,34 @@ def main(business_file, query_file, primary_column, output_file):
     # Merge the two dataframes (Business & System) on the primary column
     matched_df = pd.merge(input_df, query_df, left_on=primary_column + '_Input', right_on=primary_column + '_Output',
                           how='outer', suffixes=('_Input', '_Output'))
-    base_columns = set(col.rsplit('_', 1)[0] for col in matched_df.columns if '_' in col)
-    matched_df_copy = deepcopy(matched_df)
-    matched_df_copy = matched_df_copy.applymap(lambda x: x.strip() if isinstance(x, str) else x)
-    matched_df_copy = matched_df_copy.applymap(lambda x: x.upper() if isinstance(x, str) else x)
+    base_columns = get_base_columns(matched_df)
 
-    # Adding Status Column
-    for base_column in base_columns:
-        business_column = f'{base_column}_Input'
-        system_column = f'{base_column}_Output'
-        status_column = f'{base_column}_Status'
-
-        if business_column in matched_df_copy.columns and system_column in matched_df_copy.columns:
-            # Handle rounding for specific columns
-            if business_column == "Net Price _Input":
-                matched_df_copy[business_column] = matched_df_copy[business_column].round()
-                matched_df_copy[system_column] = matched_df_copy[system_column].round()
-
-            # Check for "Matched" status including empty cells
-            matched_df[status_column] = np.where(
-                (matched_df_copy[business_column].fillna('') == matched_df_copy[system_column].fillna('')),
-                'Matched',
-                'Not Matched'
-            )
-
-            # Get the current column names
-            cols = list(matched_df.columns)
-            if business_column in cols:
-                cols.remove(business_column)
-            if system_column in cols:
-                cols.remove(system_column)
-            if status_column in cols:
-                cols.remove(status_column)
-            cols.extend([business_column, system_column, status_column])
-            matched_df = matched_df[cols]
+    # Adding Status Column, normalizing only the compared columns; with workers, the columns are compared
+    # in that many processes at once
+    # Net Price is compared to whole units (DEFAULT_RULES)
+    rules = merge_rules()
+    status_matrix = (build_parallel_status_matrix(matched_df, base_columns, rules, mode='shadow', workers=workers)
+                     if workers else build_shadow_status_matrix(matched_df, base_columns, rules=rules))
+    status_columns = status_matrix.status_columns
 
     # Adding Pass/Fail Column
-    status_columns = [col for col in matched_df.columns if col.endswith('_Status')]
-    matched_df['Result'] = matched_df[status_columns].apply(
-        lambda row: 'Fail' if 'Not Matched' in row.values else 'Pass', axis=1)
+    output_columns = status_matrix.expand_all()
+    output_columns['Result'], _ = summarize_rows(status_matrix)
 
-    # Ensuring 'Result' column is added at the end
-    cols = list(matched_df.columns)
-    if 'Result' in cols:
-        cols.remove('Result')
-    cols.append('Result')
-    matched_df = matched_df[cols]
+    # Lay out the Input/Output/Status triples and Result in a single copy
+    matched_df = assemble_output_frame(matched_df, output_columns,
+                                       plan_column_layout(matched_df.columns, status_columns, ['Result']))
 
     # Add the count of matched rows to each status column
     summary_row = pd.Series([''] * len(matched_df.columns), index=matched_df.columns)
     for status_column in status_columns:
-        summary_row[status_column] = f"Total Matched: {(matched_df[status_column] == 'Matched').sum()}"
+        summary_row[status_column] = f"Total Matched: {len(matched_df) - status_matrix.column_error_count(status_column)}"
 
     # Adding the summary row to the DataFrame
     matched_df = pd.concat([matched_df, pd.DataFrame([summary_row])], ignore_index=True)
 
     output_file = fr"D:\Work\Output_Sheets\{output_file}_output.xlsx"
-    matched_df.to_excel(output_file, index=False)
+    write_results(output_file, [('Sheet1', matched_df, False)])
     print("File Created Successfully.............")
 
 
@@ -1,18 +1,23 @@
 import pandas as pd
-import numpy as np
-from copy import deepcopy
+from compare_engine import (merge_rules, get_base_columns, build_shadow_status_matrix, plan_column_layout,
+                            assemble_output_frame, summarize_rows, build_summary_frame, build_mismatch_frame)
+from parallel_status import build_parallel_status_matrix
+from ingest import read_excel_parallel
+from excel_output import write_results
 
 def normalize_text(text):
     if isinstance(text, str):
         # Remove newline characters, multiple spaces and strip leading/trailing spaces
         return ' '.join(text.replace('\n', ' ').split()).upper()
     return text
-def main(business_file, query_file, primary_column, output_file):
+
+def main(business_file, query_file, primary_column, output_file, matched_format='xlsx', split_mode='sheets',
+         workers=None):
     try:
         # Load data from Excel files
         print(f"Loading data from {business_file} and {query_file}")
-        input_df = pd.read_excel(business_file, sheet_name='Sheet1')
-        query_df = pd.read_excel(query_file)
+        # Both files are parsed at the same time in separate processes
+        input_df, query_df = read_excel_parallel([(business_file, 'Sheet1'), (query_file, 0)])
 
         # Rename the primary column in both dataframes
         input_df = input_df.rename(columns={primary_column: primary_column + '_Input'})
@@ -22,91 +27,48 @@ def main(business_file, query_file, primary_column, output_file):
         print("Merging dataframes")
         matched_df = pd.merge(input_df, query_df, left_on=primary_column + '_Input', right_on=primary_column + '_Output', how='outer', suffixes=('_Input', '_Output'))
 
-        base_columns = set(col.rsplit('_', 1)[0] for col in matched_df.columns if '_' in col)
-        matched_df_copy = deepcopy(matched_df)
-        matched_df_copy = matched_df_copy.applymap(lambda x: x.strip() if isinstance(x, str) else x)
-        matched_df_copy = matched_df_copy.applymap(lambda x: x.upper() if isinstance(x, str) else x)
+        base_columns = get_base_columns(matched_df)
 
-        # Adding Status Column
+        # Adding Status Column, normalizing only the compared columns; with workers, the columns are compared
+        # in that many processes at once
         print("Adding status columns")
-        for base_column in base_columns:
-            business_column = f'{base_column}_Input'
-            system_column = f'{base_column}_Output'
-            status_column = f'{base_column}_Status'
-
-            if business_column in matched_df_copy.columns and system_column in matched_df_copy.columns:
-                # Handle rounding for specific columns
-                if business_column == "Net Price _Input":
-                    matched_df_copy[business_column] = matched_df_copy[business_column].round()
-                    matched_df_copy[system_column] = matched_df_copy[system_column].round()
-
-                # Check for "Matched" status
-                matched_df[status_column] = np.where(
-                    (matched_df_copy[business_column].fillna('') == matched_df_copy[system_column].fillna('')),
-                    'Matched',
-                    'Not Matched'
-                )
-
-                # Reorder columns
-                cols = list(matched_df.columns)
-                if business_column in cols:
-                    cols.remove(business_column)
-                if system_column in cols:
-                    cols.remove(system_column)
-                if status_column in cols:
-                    cols.remove(status_column)
-                cols.extend([business_column, system_column, status_column])
-                matched_df = matched_df[cols]
+        # Net Price is compared to whole units (DEFAULT_RULES)
+        rules = merge_rules()
+        status_matrix = (build_parallel_status_matrix(matched_df, base_columns, rules, mode='shadow', workers=workers)
+                         if workers else build_shadow_status_matrix(matched_df, base_columns, rules=rules))
+        status_columns = status_matrix.status_columns
 
         # Adding Pass/Fail Column
         print("Adding Pass/Fail column")
-        status_columns = [col for col in matched_df.columns if col.endswith('_Status')]
-        matched_df['Result'] = matched_df[status_columns].apply(
-            lambda row: 'Fail' if 'Not Matched' in row.values else 'Pass', axis=1
-        )
+        output_columns = status_matrix.expand_all()
+        output_columns['Result'], _ = summarize_rows(status_matrix)
 
-        # Ensuring 'Result' column is added at the end
-        cols = list(matched_df.columns)
-        if 'Result' in cols:
-            cols.remove('Result')
-        cols.append('Result')
-        matched_df = matched_df[cols]
+        # Lay out the Input/Output/Status triples and Result in a single copy
+        matched_df = assemble_output_frame(matched_df, output_columns,
+                                           plan_column_layout(matched_df.columns, status_columns, ['Result']))
 
         # Add summary row for each status column
         print("Adding summary row")
         summary_row = pd.Series([''] * len(matched_df.columns), index=matched_df.columns)
-        for status_column in status_columns:
-            matched_count = (matched_df[status_column] == 'Matched').sum()
-            total_count = len(matched_df)
-            error_count = (matched_df[status_column] == 'Not Matched').sum()
-            error_percentage = (error_count * 100.0) / total_count if total_count > 0 else 0
-            summary_row[status_column] = f"Total Matched: {matched_count}, Error: {error_count}, Percent Error: {error_percentage:.2f}%"
+        summary_df = build_summary_frame(status_matrix, len(matched_df))
+        for status_column, matched_count, error_count, error_percentage in zip(
+                status_columns, summary_df['Total Matched'], summary_df['Error'], summary_df['Percent Error']):
+            summary_row[status_column] = f"Total Matched: {matched_count}, Error: {error_count}, Percent Error: {error_percentage}"
 
         # Adding the summary row to the DataFrame
         matched_df = pd.concat([matched_df, pd.DataFrame([summary_row])], ignore_index=True)
 
         # Identifying mismatched rows and columns
         print("Identifying mismatched rows and columns")
-        mismatch_data = []
-        for index, row in matched_df.iterrows():
-            mismatched_columns = [col for col in status_columns if row[col] == 'Not Matched']
-            if mismatched_columns:
-                row_data = {
-                    'Row Number': index + 1,  # Row numbers in Excel are 1-based
-                    'Id_Input': row[f'{primary_column}_Input'],
-                    'Not Matched Columns': ', '.join([col.replace('_Status', '') for col in mismatched_columns])
-                }
-                mismatch_data.append(row_data)
-
-        # Creating a DataFrame for mismatches
-        mismatch_df = pd.DataFrame(mismatch_data)
+        mismatch_df = build_mismatch_frame(status_matrix, matched_df[f'{primary_column}_Input'])
 
         # Save to Excel
         output_file_path = fr"D:\Work\Output_Sheets\{output_file}_output.xlsx"
         print(f"Saving results to {output_file_path}")
-        with pd.ExcelWriter(output_file_path, engine='openpyxl') as writer:
-            matched_df.to_excel(writer, sheet_name='Matched Data', index=False)
-            mismatch_df.to_excel(writer, sheet_name='Mismatch Data', index=False)
+        write_results(output_file_path, [('Matched Data', matched_df, False),
+                                         ('Mismatch Data', mismatch_df, False)],
+                      side_outputs={'Matched Data': matched_format} if matched_format != 'xlsx' else None,
+                      split_mode=split_mode)
 
         print("File Created Successfully.............")
 
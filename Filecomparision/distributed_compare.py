@@ -0,0 +1,310 @@
+import os
+import queue
+import shutil
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from multiprocessing.connection import Listener, Client, AuthenticationError
+import pandas as pd
+from compare_engine import (load_rules, clean_text, get_base_columns, merge_on_key, reconcile_frames,
+                            split_orphan_keys, resolve_duplicate_keys, add_key_index)
+from streaming_compare import (spill_to_buckets, load_bucket, plan_bucket_count, profile_buckets, conform_to_file,
+                               widen_like_full_merge, ResultWriter, CHUNK_ROWS, DEFAULT_MEMORY_BUDGET_MB)
+from excel_output import EXCEL_MAX_ROWS
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8770
+
+# Environment variable holding the key coordinator and workers prove to each other before any data is sent
+AUTHKEY_ENV = 'RECONCILE_AUTHKEY'
+
+# Key partitions per worker, so a fast worker takes more of them and one lost worker costs little
+PARTITIONS_PER_WORKER = 4
+
+
+def resolve_authkey(authkey=None):
+    """Function to take the shared key from the argument or RECONCILE_AUTHKEY, as bytes."""
+    authkey = authkey or os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        raise ValueError(f"Workers exchange pickled frames, so they need a shared key; set {AUTHKEY_ENV} "
+                         f"on the coordinator and every worker")
+    return authkey.encode('utf-8') if isinstance(authkey, str) else authkey
+
+
+def parse_address(address):
+    """Function to turn 'host:port' (or a (host, port) pair) into a (host, port) pair."""
+    if isinstance(address, str):
+        host, _, port = address.rpartition(':')
+        return host or DEFAULT_HOST, int(port)
+    host, port = address
+    return host, int(port)
+
+
+def reconcile_partition(input_df, query_df, primary_column, base_columns, clean_func=clean_text, rules=None,
+                        duplicate_strategy='keep', orphan_sheet=False):
+    """Function to reconcile one key partition as newCode.py reconciles two whole files.
+
+    Every key lies in one partition, so duplicate and orphan keys are
+    resolved here; with the keep strategy the merge limit applies to each
+    partition. Returns the laid-out rows, their status matrix and the
+    Duplicate Keys and Orphan Keys frames (None without orphan_sheet).
+    """
+    add_key_index(input_df, query_df, primary_column)
+    input_df, query_df, duplicate_df = resolve_duplicate_keys(input_df, query_df, primary_column, duplicate_strategy)
+    orphan_df = None
+    if orphan_sheet:
+        input_df, query_df, orphan_df = split_orphan_keys(input_df, query_df, primary_column)
+    matched_df, status_matrix = reconcile_frames(input_df, query_df, primary_column, clean_func, base_columns,
+                                                 rules=rules)
+    return matched_df, status_matrix, duplicate_df, orphan_df
+
+
+def serve_partitions(connection):
+    """Function to reconcile the partitions a coordinator sends over one connection until it closes."""
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message[0] == 'close':
+            return
+        _, partition, arguments = message
+        try:
+            result = reconcile_partition(**arguments)
+            reply = ('ok', partition, result)
+            print(f"Reconciled partition {partition + 1} ({len(result[0])} rows)")
+        except Exception as e:
+            reply = ('error', partition, str(e))
+            print(f"Partition {partition + 1} failed: {e}")
+        connection.send(reply)
+
+
+def serve_worker(host=DEFAULT_HOST, port=DEFAULT_PORT, authkey=None, ready=None):
+    """Reconcile the partitions sent by coordinators, one coordinator at a time, until interrupted.
+
+    With port 0 a free port is picked; ready, a pipe end, then receives
+    the address the worker listens on.
+    """
+    authkey = resolve_authkey(authkey)
+    with Listener((host, port), authkey=authkey) as listener:
+        if ready is not None:
+            ready.send(listener.address)
+        print(f"Reconciliation worker listening on {listener.address[0]}:{listener.address[1]}")
+        try:
+            while True:
+                try:
+                    connection = listener.accept()
+                except (AuthenticationError, OSError) as e:
+                    print(f"Rejected a connection: {e}")
+                    continue
+                with connection:
+                    serve_partitions(connection)
+        except KeyboardInterrupt:
+            print("Stopping reconciliation worker")
+
+
+def start_local_workers(count, authkey):
+    """Function to start count workers on this machine and return their processes and addresses."""
+    processes, addresses = [], []
+    for _ in range(count):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=serve_worker, args=(DEFAULT_HOST, 0, authkey, sender), daemon=True)
+        process.start()
+        processes.append(process)
+        addresses.append(receiver.recv())
+    return processes, addresses
+
+
+def drive_worker(address, authkey, tasks, load_partition, deliver, errors, arguments):
+    """Function to feed partitions from tasks to one worker until none are left; False when the worker is lost."""
+    try:
+        connection = Client(address, authkey=authkey)
+    except (OSError, AuthenticationError) as e:
+        print(f"Worker {address[0]}:{address[1]} is unavailable: {e}")
+        return False
+    with connection:
+        while not errors:
+            try:
+                partition = tasks.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                input_df, query_df = load_partition(partition)
+            except Exception as e:
+                errors.append(f"Partition {partition + 1} could not be loaded: {e}")
+                break
+            try:
+                connection.send(('reconcile', partition, dict(arguments, input_df=input_df, query_df=query_df)))
+                del input_df, query_df
+                status, _, payload = connection.recv()
+            except (OSError, EOFError) as e:
+                # The partition goes back in the queue for the workers still running
+                print(f"Lost worker {address[0]}:{address[1]} ({e!r}); partition {partition + 1} will be retried")
+                tasks.put(partition)
+                return False
+            if status == 'error':
+                errors.append(f"Partition {partition + 1} failed on {address[0]}:{address[1]}: {payload}")
+                break
+            try:
+                deliver(partition, payload)
+            except Exception as e:
+                errors.append(f"Partition {partition + 1} could not be written: {e}")
+                break
+            print(f"Partition {partition + 1} reconciled on {address[0]}:{address[1]}")
+        try:
+            connection.send(('close',))
+        except OSError:
+            pass
+    return True
+
+
+def run_partitions(partitions, load_partition, deliver, addresses, authkey, arguments):
+    """Function to reconcile every partition on the workers, handing each result to deliver as it arrives.
+
+    load_partition(partition) returns the frame pair of a partition, so
+    only the partitions being reconciled are in memory. deliver is called
+    one result at a time. A lost worker's partition is retried on the
+    workers still running.
+    """
+    tasks = queue.Queue()
+    for partition in partitions:
+        tasks.put(partition)
+    delivered = set()
+    lock = threading.Lock()
+    errors = []
+
+    def deliver_once(partition, payload):
+        with lock:
+            deliver(partition, payload)
+            delivered.add(partition)
+
+    live_addresses = list(addresses)
+    while not tasks.empty() and live_addresses and not errors:
+        alive = {}
+
+        def drive(address):
+            alive[address] = drive_worker(address, authkey, tasks, load_partition, deliver_once, errors, arguments)
+
+        threads = [threading.Thread(target=drive, args=(address,)) for address in live_addresses]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        live_addresses = [address for address in live_addresses if alive.get(address)]
+
+    if errors:
+        raise RuntimeError(errors[0])
+    missing = len(partitions) - len(delivered)
+    if missing:
+        raise RuntimeError(f"No worker was left to reconcile {missing} of {len(partitions)} partitions")
+
+
+def main(business_file, query_file, primary_column, output_file, workers=2, rules_file=None, orphan_sheet=False,
+         duplicate_strategy='keep', partitions=None, authkey=None, clean_func=clean_text,
+         memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, spill_dir=None, chunk_rows=CHUNK_ROWS, max_rows=EXCEL_MAX_ROWS):
+    """Reconcile two files on several workers, each comparing the keys of its partitions.
+
+    workers is a list of 'host:port' addresses of running workers
+    (serve_worker), or a number of workers to start on this machine. Both
+    files are spilled to disk in key partitions, as streaming_compare.py
+    does, so the coordinator holds only the partitions being reconciled
+    and never a whole file. Every key lies in one partition and is
+    compared on one worker; the partition results are written into one
+    workbook as they arrive, with the sheets newCode.py writes. The rows
+    of Matched Data are grouped by partition instead of following the key
+    order, and sheets over Excel's row limit continue on numbered sheets.
+    """
+    local_processes = []
+    work_dir = None
+    writer = None
+    try:
+        if isinstance(workers, int):
+            authkey = resolve_authkey(authkey or os.environ.get(AUTHKEY_ENV) or os.urandom(32))
+            print(f"Starting {workers} local workers")
+            local_processes, addresses = start_local_workers(workers, authkey)
+        else:
+            authkey = resolve_authkey(authkey)
+            addresses = [parse_address(address) for address in workers]
+
+        # Split both files on disk, so every key lands in one partition
+        work_dir = tempfile.mkdtemp(prefix='reconcile_', dir=spill_dir)
+        n_partitions = partitions or max(len(addresses) * PARTITIONS_PER_WORKER,
+                                         plan_bucket_count([business_file, query_file], memory_budget_mb))
+        print(f"Spilling {business_file} and {query_file} into {n_partitions} key partitions under {work_dir}")
+        input_columns = spill_to_buckets(business_file, 'Sheet1', primary_column, n_partitions, work_dir, 'input',
+                                         chunk_rows)
+        query_columns = spill_to_buckets(query_file, None, primary_column, n_partitions, work_dir, 'query',
+                                         chunk_rows)
+
+        # Column types and merge gaps are fixed over the whole files; without orphan keys there are no gaps
+        print("Profiling the key partitions")
+        key_partitions, input_dtypes, query_dtypes, gaps = profile_buckets(
+            work_dir, n_partitions, input_columns, query_columns, primary_column, find_gaps=not orphan_sheet)
+
+        def load_partition(partition):
+            input_df = conform_to_file(load_bucket(work_dir, 'input', partition, input_columns), input_dtypes)
+            query_df = conform_to_file(load_bucket(work_dir, 'query', partition, query_columns), query_dtypes)
+            return widen_like_full_merge(input_df, query_df, gaps)
+
+        # Write every partition as it arrives; the Duplicate Keys rows are few and sorted over all partitions
+        writer = ResultWriter(primary_column, max_rows,
+                              (['Orphan Keys'] if orphan_sheet else []) + ['Duplicate Keys'])
+        duplicate_frames = []
+
+        def deliver(partition, payload):
+            matched_df, status_matrix, duplicate_df, orphan_df = payload
+            writer.add_pair(matched_df, status_matrix)
+            if orphan_df is not None:
+                writer.add_rows('Orphan Keys', orphan_df)
+            if not duplicate_df.empty:
+                duplicate_frames.append(duplicate_df)
+
+        # Fix the compared columns once so every partition produces the same layout
+        base_columns = get_base_columns(merge_on_key(pd.DataFrame(columns=input_columns),
+                                                     pd.DataFrame(columns=query_columns), primary_column))
+        print(f"Reconciling {len(key_partitions)} key partitions on {len(addresses)} workers")
+        arguments = {'primary_column': primary_column, 'base_columns': base_columns, 'clean_func': clean_func,
+                     'rules': load_rules(rules_file) if rules_file else None,
+                     'duplicate_strategy': duplicate_strategy, 'orphan_sheet': orphan_sheet}
+        run_partitions(key_partitions, load_partition, deliver, addresses, authkey, arguments)
+
+        if duplicate_frames:
+            duplicate_df = pd.concat(duplicate_frames, ignore_index=True)
+            writer.add_rows('Duplicate Keys', duplicate_df.sort_values('Merged Rows', ascending=False, kind='stable'))
+        else:
+            writer.drop_sheet('Duplicate Keys')
+
+        # Add the unique column names row and the summary, counted over every partition
+        print("Adding unique column names row and summary")
+        workbook, summary_df = writer.finish()
+        writer = None
+
+        # Save to Excel
+        output_file_path = fr"D:\Work\Output_Sheets\{output_file}_output.xlsx"
+        print(f"Saving results to {output_file_path}")
+        workbook.save(output_file_path)
+
+        print("File Created Successfully.............")
+        return [output_file_path], summary_df
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+    finally:
+        if writer is not None:
+            writer.discard()
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        for process in local_processes:
+            process.terminate()
+            process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Run a reconciliation worker. Coordinators connect to it with "
+                                                 f"distributed_compare.main; both need the key in {AUTHKEY_ENV}.")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    serve_worker(args.host, args.port)
@@ -0,0 +1,217 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from openpyxl import Workbook
+
+# Rows converted to Excel values at a time, which bounds the extra memory the writer needs
+BATCH_ROWS = 50000
+
+SIDE_OUTPUT_FORMATS = ('csv', 'parquet')
+
+# Rows an Excel worksheet can hold, header included
+EXCEL_MAX_ROWS = 1048576
+
+# A sheet that does not fit continues on numbered sheets of the same workbook, or in numbered workbooks
+SPLIT_MODES = ('sheets', 'workbooks')
+
+# Columns of the table that tells where each part of a split sheet was written
+SHARD_INDEX_COLUMNS = ['Split Sheet', 'Part', 'Location', 'First Row', 'Last Row']
+
+
+def iter_sheet_rows(df):
+    """Function to yield the rows of df as tuples of Excel-safe values (missing values become empty cells)."""
+    values = df.astype(object).where(df.notna(), None)
+    yield from values.itertuples(index=False, name=None)
+
+
+def append_frame(worksheet, df, index=False, batch_rows=BATCH_ROWS):
+    """Function to append the rows of df to a write-only worksheet, batch_rows rows at a time."""
+    if index:
+        df = df.reset_index()
+    for start in range(0, len(df), batch_rows):
+        for row in iter_sheet_rows(df.iloc[start:start + batch_rows]):
+            worksheet.append(row)
+
+
+def shard_sheet_name(sheet_name, part):
+    """Function to name part n of a split sheet ('Matched Data', 'Matched Data 2', ...) within Excel's 31 characters."""
+    if part == 1:
+        return sheet_name
+    suffix = f' {part}'
+    return sheet_name[:31 - len(suffix)] + suffix
+
+
+def shard_workbook_path(output_file_path, sheet_name, part):
+    """Function to name the workbook that holds part n of a sheet split across workbooks."""
+    base_path = os.path.splitext(output_file_path)[0]
+    return f"{base_path}_{sheet_name.replace(' ', '_')}_{part}.xlsx"
+
+
+def plan_shards(n_rows, max_rows=EXCEL_MAX_ROWS):
+    """Function to split n_rows data rows into (start, stop) ranges that each fit a sheet below its header row."""
+    rows_per_shard = max_rows - 1
+    return [(start, min(start + rows_per_shard, n_rows)) for start in range(0, n_rows, rows_per_shard)] or [(0, 0)]
+
+
+class ShardedSheet:
+    """Write-only worksheet that continues on a numbered sheet whenever it reaches the row limit.
+
+    Used when rows arrive incrementally and the total is not known up
+    front. parts lists [sheet name, part, location, first row, last row]
+    for every sheet written, with rows counted over the data rows only.
+    """
+
+    def __init__(self, workbook, sheet_name, max_rows=EXCEL_MAX_ROWS):
+        self.workbook = workbook
+        self.sheet_name = sheet_name
+        self.max_rows = max_rows
+        self.header = None
+        self.rows_written = 0
+        self.parts = []
+        self._new_part()
+
+    def _new_part(self):
+        """Function to start the next numbered sheet, repeating the header on it."""
+        location = shard_sheet_name(self.sheet_name, len(self.parts) + 1)
+        self._worksheet = self.workbook.create_sheet(location)
+        self._rows_in_part = 0
+        self.parts.append([self.sheet_name, len(self.parts) + 1, location, self.rows_written + 1, self.rows_written])
+        if self.header is not None:
+            self._worksheet.append(self.header)
+            self._rows_in_part = 1
+
+    def append_header(self, header):
+        """Function to write the header row, which is repeated at the top of every later part."""
+        self.header = list(header)
+        self._worksheet.append(self.header)
+        self._rows_in_part += 1
+
+    def append(self, row):
+        """Function to append one data row, moving on to a new sheet when the current one is full."""
+        if self._rows_in_part >= self.max_rows:
+            self._new_part()
+        self._worksheet.append(row)
+        self._rows_in_part += 1
+        self.rows_written += 1
+        self.parts[-1][4] = self.rows_written
+
+
+def side_output_path(output_file_path, sheet_name, side_format):
+    """Function to name the CSV/Parquet file that holds a sheet written outside the workbook."""
+    base_path = os.path.splitext(output_file_path)[0]
+    return f"{base_path}_{sheet_name.replace(' ', '_')}.{side_format}"
+
+
+def write_side_output(df, path, side_format, index=False, batch_rows=BATCH_ROWS):
+    """Function to write one sheet as a CSV or Parquet file."""
+    if side_format == 'csv':
+        df.to_csv(path, index=index, chunksize=batch_rows)
+    elif side_format == 'parquet':
+        try:
+            df.to_parquet(path, index=index)
+        except (ValueError, TypeError):
+            # Parquet columns need one type; store columns that mix numbers and text as text
+            mixed_columns = df.columns[df.dtypes == object]
+            df = df.copy()
+            df[mixed_columns] = df[mixed_columns].apply(lambda col: col.where(col.isna(), col.astype(str)))
+            df.to_parquet(path, index=index)
+    else:
+        raise ValueError(f"Unknown side output format {side_format!r}, expected one of {SIDE_OUTPUT_FORMATS}")
+
+
+def write_sheet(workbook, sheet_name, df, index=False, batch_rows=BATCH_ROWS):
+    """Function to write df with its header row as a new sheet of a write-only workbook."""
+    worksheet = workbook.create_sheet(sheet_name)
+    header = ([df.index.name] if index else []) + list(df.columns)
+    if len(df.columns) or index:
+        worksheet.append(header)
+    append_frame(worksheet, df, index, batch_rows)
+    return worksheet
+
+
+def write_workbook(path, sheets, batch_rows=BATCH_ROWS, appendices=None):
+    """Function to write (sheet name, DataFrame, write index) sheets to one write-only workbook.
+
+    appendices maps a sheet name to a frame written below that sheet after
+    an empty row. Kept at module level so it can run in a worker process.
+    """
+    appendices = appendices or {}
+    workbook = Workbook(write_only=True)
+    for sheet_name, df, index in sheets:
+        worksheet = write_sheet(workbook, sheet_name, df, index, batch_rows)
+        if sheet_name in appendices:
+            worksheet.append([])
+            worksheet.append(list(appendices[sheet_name].columns))
+            append_frame(worksheet, appendices[sheet_name], False, batch_rows)
+
+    if not workbook.worksheets:
+        # A workbook needs at least one sheet
+        workbook.create_sheet('Sheet1')
+    workbook.save(path)
+    return path
+
+
+def write_results(output_file_path, sheets, side_outputs=None, batch_rows=BATCH_ROWS, split_mode='sheets',
+                  max_rows=EXCEL_MAX_ROWS, summary_sheet='Summary Data', max_workers=None):
+    """Function to write the result sheets to an .xlsx in write-only (constant memory) mode.
+
+    sheets is a list of (sheet name, DataFrame, write index) in workbook
+    order. side_outputs maps a sheet name to 'csv' or 'parquet'; that sheet
+    is written next to the workbook instead of into it. A sheet with more
+    rows than Excel allows is split into numbered sheets ('sheets') or
+    numbered workbooks written in parallel processes ('workbooks'), and
+    the parts are listed below summary_sheet. Returns the paths written,
+    workbook first.
+    """
+    if split_mode not in SPLIT_MODES:
+        raise ValueError(f"Unknown split mode {split_mode!r}, expected one of {SPLIT_MODES}")
+    side_outputs = side_outputs or {}
+    written_paths = [output_file_path]
+    workbook_sheets = []
+    shard_workbooks = []
+    shard_index = []
+    for sheet_name, df, index in sheets:
+        if sheet_name in side_outputs:
+            path = side_output_path(output_file_path, sheet_name, side_outputs[sheet_name])
+            print(f"Writing {sheet_name} to {path}")
+            write_side_output(df, path, side_outputs[sheet_name], index, batch_rows)
+            written_paths.append(path)
+            continue
+
+        shards = plan_shards(len(df), max_rows)
+        if len(shards) == 1:
+            workbook_sheets.append((sheet_name, df, index))
+            continue
+
+        print(f"{sheet_name} has {len(df)} rows, more than a sheet holds; splitting it into {len(shards)} parts")
+        for part, (start, stop) in enumerate(shards, 1):
+            if part == 1 or split_mode == 'sheets':
+                location = shard_sheet_name(sheet_name, part)
+                workbook_sheets.append((location, df.iloc[start:stop], index))
+            else:
+                path = shard_workbook_path(output_file_path, sheet_name, part)
+                location = f"{os.path.basename(path)} [{sheet_name}]"
+                shard_workbooks.append((path, [(sheet_name, df.iloc[start:stop], index)]))
+            shard_index.append([sheet_name, part, location, start + 1, stop])
+
+    # Cross-reference the parts from the summary sheet, or from a sheet of their own when there is none
+    appendices = {}
+    if shard_index:
+        shard_index_df = pd.DataFrame(shard_index, columns=SHARD_INDEX_COLUMNS)
+        if any(sheet_name == summary_sheet for sheet_name, _, _ in workbook_sheets):
+            appendices[summary_sheet] = shard_index_df
+        else:
+            workbook_sheets.append((summary_sheet, shard_index_df, False))
+
+    if not shard_workbooks:
+        write_workbook(output_file_path, workbook_sheets, batch_rows, appendices)
+        return written_paths
+
+    # Each extra workbook is written by its own process while this one writes the main workbook
+    max_workers = max_workers or min(len(shard_workbooks), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(write_workbook, path, shard_sheets, batch_rows)
+                   for path, shard_sheets in shard_workbooks]
+        write_workbook(output_file_path, workbook_sheets, batch_rows, appendices)
+        written_paths.extend(future.result() for future in futures)
+    return written_paths
@@ -0,0 +1,154 @@
+import os
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# Parsed workbooks are kept here, keyed by file content and sheet
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.reconcile_cache')
+
+# Bump when the way workbooks are parsed changes, so old cache files are not reused
+CACHE_VERSION = 1
+
+# Parsed sheets a long-running process (compare_service.py) keeps in memory, newest last; off by default
+_memory_cache = OrderedDict()
+_memory_cache_size = 0
+
+
+def excel_engine():
+    """Function to pick the fastest installed Excel reader (calamine is a Rust parser, openpyxl is pure Python)."""
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return 'openpyxl'
+    return 'calamine'
+
+
+def file_digest(file_path, block_size=1024 * 1024):
+    """Function to hash the content of a file, so a renamed or copied file still hits the cache."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_path(file_path, sheet_name, cache_dir=CACHE_DIR):
+    """Function to build the cache file path (without extension) for one sheet of one file."""
+    sheet_key = hashlib.sha256(str(sheet_name).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, f'v{CACHE_VERSION}_{file_digest(file_path)}_{sheet_key}')
+
+
+def save_cached_frame(df, path):
+    """Function to persist a parsed frame as Parquet, or as a pickle when Parquet cannot hold it."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        df.to_parquet(path + '.parquet.tmp', index=False)
+        os.replace(path + '.parquet.tmp', path + '.parquet')
+    except (ImportError, ValueError, TypeError):
+        # No pyarrow installed, or a column mixes numbers and text
+        if os.path.exists(path + '.parquet.tmp'):
+            os.remove(path + '.parquet.tmp')
+        df.to_pickle(path + '.pkl.tmp')
+        os.replace(path + '.pkl.tmp', path + '.pkl')
+
+
+def load_cached_frame(path):
+    """Function to load a cached frame, or return None when the sheet has not been parsed before."""
+    if os.path.exists(path + '.parquet'):
+        df = pd.read_parquet(path + '.parquet')
+        # Parquet hands missing text back as None; pd.read_excel gives NaN
+        object_columns = df.columns[df.dtypes == object]
+        df[object_columns] = df[object_columns].fillna(np.nan)
+        return df
+    if os.path.exists(path + '.pkl'):
+        return pd.read_pickle(path + '.pkl')
+    return None
+
+
+def set_memory_cache_size(size):
+    """Function to keep up to size recently read sheets in memory, on top of the on-disk cache (0 turns it off)."""
+    global _memory_cache_size
+    _memory_cache_size = size
+    while len(_memory_cache) > size:
+        _memory_cache.popitem(last=False)
+
+
+def memory_cache_info():
+    """Function to report how many sheets the in-memory cache holds and may hold."""
+    return {'sheets': len(_memory_cache), 'max_sheets': _memory_cache_size}
+
+
+def remember_frame(path, df):
+    """Function to store a copy of a parsed frame in the in-memory cache under its cache path."""
+    if _memory_cache_size <= 0:
+        return
+    _memory_cache[path] = df.copy()
+    _memory_cache.move_to_end(path)
+    while len(_memory_cache) > _memory_cache_size:
+        _memory_cache.popitem(last=False)
+
+
+def recall_frame(path):
+    """Function to return a copy of a frame from the in-memory cache, or None when it is not there."""
+    if path not in _memory_cache:
+        return None
+    _memory_cache.move_to_end(path)
+    # A copy, so a caller changing its frame cannot change the cached one
+    return _memory_cache[path].copy()
+
+
+def load_frame(path):
+    """Function to load a frame from the in-memory cache, then the on-disk cache; None when neither has it."""
+    df = recall_frame(path)
+    if df is not None:
+        return df
+    df = load_cached_frame(path)
+    if df is not None:
+        remember_frame(path, df)
+    return df
+
+
+def parse_sheet(file_path, sheet_name, path):
+    """Function to parse one sheet with the fastest reader and store its columnar copy at path."""
+    df = pd.read_excel(file_path, sheet_name=sheet_name, engine=excel_engine())
+    save_cached_frame(df, path)
+    return df
+
+
+def read_excel_cached(file_path, sheet_name=0, cache_dir=CACHE_DIR):
+    """Function to read one sheet like pd.read_excel, reusing the columnar copy from an earlier run."""
+    path = cache_path(file_path, sheet_name, cache_dir)
+    df = load_frame(path)
+    if df is not None:
+        print(f"Loaded {file_path} [{sheet_name}] from cache")
+        return df
+    df = parse_sheet(file_path, sheet_name, path)
+    remember_frame(path, df)
+    return df
+
+
+def read_excel_parallel(sheets, cache_dir=CACHE_DIR, max_workers=None):
+    """Function to read several (file_path, sheet_name) sheets, parsing the uncached ones concurrently.
+
+    Parsing is CPU bound, so the sheets are parsed in separate processes;
+    the frames come back in the order of sheets.
+    """
+    paths = [cache_path(file_path, sheet_name, cache_dir) for file_path, sheet_name in sheets]
+    frames = [load_frame(path) for path in paths]
+    missing = [position for position, df in enumerate(frames) if df is None]
+
+    if len(missing) == 1:
+        file_path, sheet_name = sheets[missing[0]]
+        frames[missing[0]] = parse_sheet(file_path, sheet_name, paths[missing[0]])
+    elif missing:
+        max_workers = max_workers or min(len(missing), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {position: executor.submit(parse_sheet, *sheets[position], paths[position])
+                       for position in missing}
+            for position, future in futures.items():
+                frames[position] = future.result()
+    for position in missing:
+        remember_frame(paths[position], frames[position])
+    return frames
@@ -0,0 +1,295 @@
+import os
+import argparse
+import multiprocessing
+from multiprocessing.connection import Listener, Client, AuthenticationError
+import numpy as np
+import pandas as pd
+from compare_engine import (load_rules, clean_text, reconcile_frames, build_status_matrix, build_summary_frame,
+                            build_mismatch_frame, split_orphan_keys, resolve_duplicate_keys, add_key_index, key_values,
+                            key_columns, row_fingerprints, FINGERPRINT_PRIME)
+from streaming_compare import bucket_of
+from distributed_compare import resolve_authkey, parse_address, DEFAULT_HOST, AUTHKEY_ENV
+from ingest import read_excel_cached
+from excel_output import write_results
+
+DEFAULT_PORT = 8771
+
+# Rows per key bucket the tree aims for; fewer rows per bucket means less is fetched around each difference
+ROWS_PER_BUCKET = 64
+
+# Upper bound on the number of key buckets (leaves of the tree)
+MAX_BUCKETS = 1 << 20
+
+
+def plan_tree_buckets(n_rows, rows_per_bucket=ROWS_PER_BUCKET):
+    """Function to pick a power-of-two number of key buckets for the given number of rows."""
+    n_buckets = 1
+    while n_buckets * rows_per_bucket < n_rows and n_buckets < MAX_BUCKETS:
+        n_buckets *= 2
+    return n_buckets
+
+
+def key_occurrences(keys):
+    """Function to number the rows of every key in file order (0 for the first row of a key, 1 for the next...)."""
+    by = list(keys.columns) if isinstance(keys, pd.DataFrame) else keys
+    return keys.groupby(by, dropna=False, sort=False).cumcount().to_numpy().astype(np.uint64)
+
+
+def bucket_hashes(df, primary_column, columns, n_buckets):
+    """Function to hash the rows of every key bucket into one 64-bit value per bucket.
+
+    A row is hashed from its cell values in the given column order (the
+    engine's row fingerprint) and its place among the rows of its key,
+    and the rows of a bucket are summed: keys may come in any order, but
+    equal buckets hold the rows of every key in the same order. Returns
+    the bucket hashes and the bucket of every row.
+    """
+    keys = key_values(df, primary_column)
+    buckets = bucket_of(keys, n_buckets).astype(np.int64)
+    row_hashes = pd.util.hash_array(row_fingerprints(df, columns) * FINGERPRINT_PRIME ^ key_occurrences(keys))
+    sums = np.zeros(n_buckets, dtype=np.uint64)
+    np.add.at(sums, buckets, row_hashes)
+    counts = np.bincount(buckets, minlength=n_buckets).astype(np.uint64)
+    return pd.util.hash_array(sums * FINGERPRINT_PRIME ^ counts), buckets
+
+
+def row_identities(df, primary_column):
+    """Function to hash every row's key and place among the rows of its key; equal buckets pair rows by it."""
+    occurrences = key_occurrences(key_values(df, primary_column))
+    return pd.util.hash_array(row_fingerprints(df, key_columns(primary_column)) * FINGERPRINT_PRIME ^ occurrences)
+
+
+def build_tree(leaves):
+    """Function to build the Merkle tree over the bucket hashes, as a list of levels from the root down."""
+    levels = [leaves]
+    while len(levels[0]) > 1:
+        children = levels[0]
+        levels.insert(0, pd.util.hash_array(children[0::2] * FINGERPRINT_PRIME ^ children[1::2]))
+    return levels
+
+
+def answer_request(df, tree, message):
+    """Function to answer one request of the other side; tree keeps the levels and row buckets between requests."""
+    request = message[0]
+    if request == 'describe':
+        return {'columns': list(df.columns), 'rows': len(df)}
+    if request == 'tree':
+        _, primary_column, columns, n_buckets = message
+        leaves, tree['buckets'] = bucket_hashes(df, primary_column, columns, n_buckets)
+        tree['levels'] = build_tree(leaves)
+        return len(tree['levels'])
+    if request == 'nodes':
+        _, level, nodes = message
+        return tree['levels'][level][nodes]
+    if request == 'rows':
+        return df.take(np.flatnonzero(np.isin(tree['buckets'], message[1])))
+    if request == 'other_columns':
+        # The given columns of every row outside the given buckets, indexed by row identity
+        _, primary_column, buckets, columns = message
+        rows = np.flatnonzero(~np.isin(tree['buckets'], buckets))
+        return df[columns].take(rows).set_axis(row_identities(df, primary_column)[rows])
+    raise ValueError(f"Unknown request {request!r}")
+
+
+def serve_side(file_path, sheet_name=0, host=DEFAULT_HOST, port=DEFAULT_PORT, authkey=None, ready=None):
+    """Serve the tree and the rows of one file to the other side, one connection at a time, until interrupted.
+
+    With port 0 a free port is picked; ready, a pipe end, then receives
+    the address the side listens on.
+    """
+    authkey = resolve_authkey(authkey)
+    df = read_excel_cached(file_path, sheet_name)
+    with Listener((host, port), authkey=authkey) as listener:
+        if ready is not None:
+            ready.send(listener.address)
+        print(f"Serving {file_path} on {listener.address[0]}:{listener.address[1]}")
+        try:
+            while True:
+                try:
+                    connection = listener.accept()
+                except (AuthenticationError, OSError) as e:
+                    print(f"Rejected a connection: {e}")
+                    continue
+                with connection:
+                    tree = {}
+                    while True:
+                        try:
+                            message = connection.recv()
+                        except EOFError:
+                            break
+                        if message[0] == 'close':
+                            break
+                        try:
+                            connection.send(('ok', answer_request(df, tree, message)))
+                        except Exception as e:
+                            connection.send(('error', str(e)))
+        except KeyboardInterrupt:
+            print(f"Stopping serving {file_path}")
+
+
+def start_local_side(file_path, sheet_name, authkey):
+    """Function to serve a file from a second process on this machine and return the process and its address."""
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=serve_side, args=(file_path, sheet_name, DEFAULT_HOST, 0, authkey, sender),
+                                      daemon=True)
+    process.start()
+    return process, receiver.recv()
+
+
+def ask(connection, *message):
+    """Function to send one request to the other side and return its answer."""
+    connection.send(message)
+    status, answer = connection.recv()
+    if status == 'error':
+        raise RuntimeError(f"The system side failed: {answer}")
+    return answer
+
+
+def differing_buckets(connection, levels):
+    """Function to walk both trees from the root down, exchanging only the hashes under differing nodes."""
+    nodes = np.zeros(1, dtype=np.int64)
+    for level, hashes in enumerate(levels):
+        remote_hashes = ask(connection, 'nodes', level, nodes)
+        nodes = nodes[hashes[nodes] != remote_hashes]
+        if level < len(levels) - 1:
+            nodes = np.sort(np.concatenate([nodes * 2, nodes * 2 + 1]))
+    return nodes
+
+
+def fetch_system_frame(input_df, connection, primary_column, rows_per_bucket=ROWS_PER_BUCKET):
+    """Function to rebuild the system frame while fetching only the rows of key buckets that differ.
+
+    The trees hash the columns both files have. A key bucket whose rows
+    hash the same on both sides holds the same values (equal as text) in
+    those columns, so the business rows stand in for it; of its system
+    rows only the columns the business file lacks are fetched.
+    """
+    description = ask(connection, 'describe')
+    system_columns = description['columns']
+    missing_keys = [column for column in key_columns(primary_column)
+                    if column not in system_columns or column not in input_df.columns]
+    if missing_keys:
+        raise ValueError(f"Both files need the key column(s) {', '.join(missing_keys)}")
+    # Both sides hash the shared columns in the same order
+    columns = sorted(set(system_columns) & set(input_df.columns))
+    system_only = [column for column in system_columns if column not in input_df.columns]
+
+    n_buckets = plan_tree_buckets(max(len(input_df), description['rows']), rows_per_bucket)
+    leaves, buckets = bucket_hashes(input_df, primary_column, columns, n_buckets)
+    levels = build_tree(leaves)
+    if ask(connection, 'tree', primary_column, columns, n_buckets) != len(levels):
+        raise RuntimeError("The two sides built trees of different depths")
+
+    changed = differing_buckets(connection, levels)
+    frames = [ask(connection, 'rows', changed)] if len(changed) else []
+    fetched_rows = len(frames[0]) if frames else 0
+    print(f"{len(changed)} of {n_buckets} key buckets differ; fetched {fetched_rows} of {description['rows']} "
+          f"system rows")
+
+    unchanged = np.flatnonzero(~np.isin(buckets, changed))
+    unchanged_rows = input_df.take(unchanged).reindex(columns=system_columns)
+    if system_only and len(unchanged):
+        print(f"Fetching the system-only columns {', '.join(map(str, system_only))} of the other "
+              f"{len(unchanged_rows)} rows")
+        other_columns = ask(connection, 'other_columns', primary_column, changed, system_only)
+        other_columns = other_columns.reindex(row_identities(input_df, primary_column)[unchanged])
+        for column in system_only:
+            unchanged_rows[column] = other_columns[column].to_numpy()
+    # Fetched rows keep their row number in the system file (reported for orphan keys); the stand-ins, whose keys
+    # are on both sides, are numbered after the last system row
+    unchanged_rows.index = pd.RangeIndex(description['rows'], description['rows'] + len(unchanged_rows))
+    return pd.concat(frames + [unchanged_rows])
+
+
+def main(business_file, query_file=None, primary_column=None, output_file=None, system_address=None,
+         matched_format='xlsx', split_mode='sheets', rules_file=None, orphan_sheet=False, duplicate_strategy='keep',
+         rows_per_bucket=ROWS_PER_BUCKET, authkey=None):
+    """Reconcile a local business file with a system file served by another host (serve_side).
+
+    Both sides hash their rows per key bucket into a Merkle tree; only the
+    tree hashes under differing buckets and the system rows of those
+    buckets cross the network. The comparison itself is newCode.py's. With
+    query_file instead of system_address, the system file is served from a
+    second local process.
+    """
+    local_side = None
+    try:
+        print(f"Loading data from {business_file}")
+        input_df = read_excel_cached(business_file, 'Sheet1')
+
+        if system_address is None:
+            authkey = resolve_authkey(authkey or os.environ.get(AUTHKEY_ENV) or os.urandom(32))
+            local_side, address = start_local_side(query_file, 0, authkey)
+        else:
+            authkey = resolve_authkey(authkey)
+            address = parse_address(system_address)
+
+        print(f"Comparing key buckets with the system side at {address[0]}:{address[1]}")
+        with Client(address, authkey=authkey) as connection:
+            query_df = fetch_system_frame(input_df, connection, primary_column, rows_per_bucket)
+            connection.send(('close',))
+
+        # Hash the (possibly composite) key of both sides once, for the duplicate, orphan and merge passes
+        add_key_index(input_df, query_df, primary_column)
+
+        # Profile repeated keys, so a many-to-many merge is resolved or refused before it runs out of memory
+        input_df, query_df, duplicate_df = resolve_duplicate_keys(input_df, query_df, primary_column,
+                                                                  duplicate_strategy)
+
+        # Keys on one side only go to their own sheet instead of being merged as all 'Not Matched' rows
+        orphan_df = None
+        if orphan_sheet:
+            print("Finding keys present on one side only")
+            input_df, query_df, orphan_df = split_orphan_keys(input_df, query_df, primary_column)
+
+        # Merge on the primary column, normalize and add the status, Result and Not Matched Count columns
+        print("Merging dataframes and adding status columns")
+        matched_df, status_matrix = reconcile_frames(input_df, query_df, primary_column, clean_text,
+                                                     status_builder=build_status_matrix,
+                                                     rules=load_rules(rules_file) if rules_file else None)
+
+        # Add unique column names row
+        print("Adding unique column names row")
+        unique_columns_row = pd.Series({col: col for col in matched_df.columns}, name='Unique Column Names')
+        matched_df = pd.concat([matched_df, unique_columns_row.to_frame().T], ignore_index=True)
+
+        # Add summary row
+        print("Adding summary row")
+        summary_df = build_summary_frame(status_matrix, len(matched_df))
+
+        # Identifying mismatched rows and columns
+        print("Identifying mismatched rows and columns")
+        mismatch_df = build_mismatch_frame(status_matrix, key_values(matched_df, primary_column, '_Input'))
+
+        # Save to Excel
+        output_file_path = fr"D:\Work\Output_Sheets\{output_file}_output.xlsx"
+        print(f"Saving results to {output_file_path}")
+        side_outputs = {'Matched Data': matched_format} if matched_format != 'xlsx' else None
+        sheets = [('Matched Data', matched_df, False), ('Mismatch Data', mismatch_df, False)]
+        if orphan_df is not None:
+            sheets.append(('Orphan Keys', orphan_df, False))
+        if not duplicate_df.empty:
+            sheets.append(('Duplicate Keys', duplicate_df, False))
+        sheets.append(('Summary Data', summary_df, True))
+        written_paths = write_results(output_file_path, sheets, side_outputs=side_outputs, split_mode=split_mode)
+
+        print("File Created Successfully.............")
+        return written_paths, summary_df
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+    finally:
+        if local_side is not None:
+            local_side.terminate()
+            local_side.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Serve a system file to a business host running "
+                                                 f"merkle_compare.main; both need the key in {AUTHKEY_ENV}.")
+    parser.add_argument('file')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    serve_side(args.file, 0, args.host, args.port)
@@ -0,0 +1,195 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from compare_engine import (StatusMatrix, build_status_matrix, build_shadow_status_matrix, build_native_status_matrix,
+                            compared_base_columns, status_kernels, column_fingerprints)
+
+# Below this many compared cells the columns are compared in this process, as starting workers costs more
+PARALLEL_MIN_CELLS = 2000000
+
+# Every buffer in a shared block starts on a multiple of this many bytes
+BUFFER_ALIGNMENT = 64
+
+# Nullable column types that are shared as their values plus a missing-value mask
+MASKED_ARRAY_TYPES = (pd.arrays.IntegerArray, pd.arrays.BooleanArray)
+
+
+def serial_status_matrix(matched_df, base_columns, rules=None, mode='text', fill_missing=True):
+    """Function to build the status matrix of one comparison mode in this process."""
+    if mode == 'shadow':
+        return build_shadow_status_matrix(matched_df, base_columns, fill_missing, rules)
+    if mode == 'native':
+        return build_native_status_matrix(matched_df, base_columns, rules)
+    return build_status_matrix(matched_df, base_columns, rules)
+
+
+def pair_mismatches(kernel, business_values, system_values, prefilter=False):
+    """Function to run kernel on one column pair; with prefilter, only on the rows whose two values differ.
+
+    Two identical values are Matched under every kernel of the text mode,
+    which is what lets build_status_matrix skip identical rows.
+    """
+    if not prefilter:
+        return kernel(business_values, system_values)
+    differing = np.flatnonzero(column_fingerprints(business_values) != column_fingerprints(system_values))
+    mismatches = np.zeros(len(business_values), dtype=bool)
+    if len(differing):
+        mismatches[differing] = kernel(business_values.take(differing), system_values.take(differing))
+    return mismatches
+
+
+def column_buffers(series):
+    """Function to split a column into (kind, dtype, arrays) that can live in shared memory, or None.
+
+    Plain numpy columns are shared as they are, nullable integer/boolean
+    columns as values plus mask, and text columns as factorize codes plus
+    their distinct values encoded as one UTF-8 buffer with offsets. Object
+    columns mixing text with numbers are not shared, since factorize would
+    fold 1, 1.0 and True into one value.
+    """
+    dtype = series.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biufcmM':
+        return 'array', dtype.str, [series.to_numpy()]
+    if isinstance(series.array, MASKED_ARRAY_TYPES):
+        mask = series.isna().to_numpy()
+        return 'masked', str(dtype), [series.to_numpy(dtype=dtype.numpy_dtype, na_value=0), mask]
+    if (dtype == object or pd.api.types.is_string_dtype(dtype)) and \
+            pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty'):
+        codes, uniques = pd.factorize(series)
+        encoded = [value.encode('utf-8', 'surrogatepass') for value in uniques]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return 'text', None, [codes, offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)]
+    return None
+
+
+def share_column_pair(business_values, system_values):
+    """Function to copy the buffers of one column pair into a new shared block.
+
+    Returns the block and the layout the worker rebuilds both columns from,
+    or (None, None) when either column cannot be shared.
+    """
+    sides = [column_buffers(business_values), column_buffers(system_values)]
+    if None in sides:
+        return None, None
+    placements, size = [], 0
+    for kind, dtype, arrays in sides:
+        placed = []
+        for array in arrays:
+            placed.append((size, array.dtype.str, len(array)))
+            size += -(-array.nbytes // BUFFER_ALIGNMENT) * BUFFER_ALIGNMENT
+        placements.append((kind, dtype, placed))
+
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for (kind, dtype, arrays), (_, _, placed) in zip(sides, placements):
+        for array, (offset, array_dtype, length) in zip(arrays, placed):
+            np.ndarray(length, dtype=array_dtype, buffer=block.buf, offset=offset)[:] = array
+    return block, placements
+
+
+def shared_column(buffer, placement):
+    """Function to rebuild a column from its buffers in a shared block, without copying its values."""
+    kind, dtype, placed = placement
+    arrays = [np.ndarray(length, dtype=array_dtype, buffer=buffer, offset=offset)
+              for offset, array_dtype, length in placed]
+    if kind == 'array':
+        return pd.Series(arrays[0], copy=False)
+    if kind == 'masked':
+        return pd.Series(pd.api.types.pandas_dtype(dtype).construct_array_type()(arrays[0], arrays[1]), copy=False)
+    codes, offsets, data = arrays
+    uniques = np.empty(len(offsets), dtype=object)
+    data, offsets = data.tobytes(), offsets.tolist()
+    uniques[:-1] = [data[start:end].decode('utf-8', 'surrogatepass') for start, end in zip(offsets[:-1], offsets[1:])]
+    # Code -1 (a missing cell) picks the NaN after the distinct values
+    uniques[-1] = np.nan
+    return pd.Series(uniques.take(codes))
+
+
+def compare_shared_pair(block_name, placements, base_column, rules=None, mode='text', fill_missing=True):
+    """Function to compare one column pair from a shared block in a worker and return its packed mismatches."""
+    block = shared_memory.SharedMemory(name=block_name)
+    try:
+        return packed_pair_mismatches(block.buf, placements, base_column, rules, mode, fill_missing)
+    finally:
+        block.close()
+
+
+def packed_pair_mismatches(buffer, placements, base_column, rules=None, mode='text', fill_missing=True):
+    """Function to compare the column pair laid out in buffer, so no view of it outlives the call."""
+    default_kernel, kernels = status_kernels(mode, rules, fill_missing)
+    mismatches = pair_mismatches(kernels.get(base_column, default_kernel), shared_column(buffer, placements[0]),
+                                 shared_column(buffer, placements[1]), mode == 'text')
+    return np.packbits(mismatches)
+
+
+def release_block(block):
+    """Function to close and remove a shared block once its column pair is compared."""
+    block.close()
+    block.unlink()
+
+
+def collect_finished(pending, packed, futures):
+    """Function to store the packed statuses of finished column pairs and release their shared blocks."""
+    for future in futures:
+        base_column, block = pending.pop(future)
+        try:
+            packed[base_column] = future.result()
+        finally:
+            release_block(block)
+
+
+def build_parallel_status_matrix(matched_df, base_columns, rules=None, mode='text', fill_missing=True,
+                                 workers=None):
+    """Function to compare the column pairs in worker processes and assemble their status matrix.
+
+    Each column pair is copied once into its own shared memory block and
+    compared by the next free worker, so the merged frame is never pickled;
+    only the packed statuses come back. Column pairs that cannot be shared
+    are compared here while the workers run. Small comparisons, and
+    workers=1, stay in this process. The statuses are the same as those of
+    the serial builder of the mode (build_status_matrix for text).
+    """
+    base_columns = compared_base_columns(base_columns, rules)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(base_columns) < 2 or len(matched_df) * len(base_columns) < PARALLEL_MIN_CELLS:
+        return serial_status_matrix(matched_df, base_columns, rules, mode, fill_missing)
+
+    workers = min(workers, len(base_columns))
+    print(f"Comparing {len(base_columns)} columns across {workers} processes")
+    default_kernel, kernels = status_kernels(mode, rules, fill_missing)
+    pending, packed = {}, {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for base_column in base_columns:
+                business_values = matched_df[f'{base_column}_Input']
+                system_values = matched_df[f'{base_column}_Output']
+                block, placements = share_column_pair(business_values, system_values)
+                if block is None:
+                    # Object columns mixing text with numbers are compared here, while the workers run
+                    packed[base_column] = np.packbits(pair_mismatches(kernels.get(base_column, default_kernel),
+                                                                      business_values, system_values, mode == 'text'))
+                    continue
+                future = executor.submit(compare_shared_pair, block.name, placements, base_column, rules, mode,
+                                         fill_missing)
+                pending[future] = (base_column, block)
+                # At most two column pairs per worker are held in shared memory at a time
+                if len(pending) >= 2 * workers:
+                    collect_finished(pending, packed, wait(pending, return_when=FIRST_COMPLETED).done)
+            collect_finished(pending, packed, list(pending))
+    finally:
+        for _, block in pending.values():
+            release_block(block)
+
+    status_matrix = StatusMatrix(len(matched_df))
+    for base_column in base_columns:
+        status_matrix.add_packed_column(f'{base_column}_Status', packed[base_column])
+    return status_matrix
+
+
+def make_parallel_status_builder(workers=None, mode='text', fill_missing=True):
+    """Function to build a reconcile_frames status_builder that compares the columns in worker processes."""
+    def build_status_matrix_in_parallel(matched_df, base_columns, rules=None):
+        return build_parallel_status_matrix(matched_df, base_columns, rules, mode, fill_missing, workers)
+    return build_status_matrix_in_parallel
@@ -0,0 +1,111 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from compare_engine import StatusMatrix, build_status_matrix, compared_base_columns, key_columns
+
+# Row hashes and statuses of earlier runs are kept here, one file per snapshot name
+SNAPSHOT_DIR = os.path.join(os.path.expanduser('~'), '.reconcile_snapshots')
+
+# Bump when the status of a row could come out differently for the same values, so old snapshots are not reused
+SNAPSHOT_VERSION = 2
+
+
+def snapshot_path(snapshot_name, snapshot_dir=SNAPSHOT_DIR):
+    """Function to build the file path of a named snapshot."""
+    return os.path.join(snapshot_dir, f'{snapshot_name}.pkl')
+
+
+def row_hashes(df, columns):
+    """Function to hash the values of the given columns of every row into one 64-bit number per row."""
+    if not columns:
+        return np.zeros(len(df), dtype=np.uint64)
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+def row_keys(matched_df, primary_column):
+    """Function to take the primary key of every merged row from whichever side has it."""
+    keys = [matched_df[f'{column}_Input'].combine_first(matched_df[f'{column}_Output'])
+            for column in key_columns(primary_column)]
+    if len(keys) == 1:
+        return keys[0]
+    # A composite key is kept as one 64-bit hash of its values, which is the same from run to run
+    return pd.Series(pd.util.hash_pandas_object(pd.concat(keys, axis=1), index=False).to_numpy(),
+                     index=matched_df.index)
+
+
+def rules_key(rules):
+    """Function to turn the comparison rules into a stable string, so a snapshot is only reused under the same rules."""
+    return json.dumps(rules or {}, sort_keys=True, default=str)
+
+
+def load_snapshot(path, status_columns, rules=None):
+    """Function to load the snapshot of an earlier run, or None when there is none or it cannot be reused."""
+    if not os.path.exists(path):
+        return None
+    snapshot = pd.read_pickle(path)
+    if (snapshot.get('version') != SNAPSHOT_VERSION or snapshot.get('status_columns') != sorted(status_columns)
+            or snapshot.get('rules') != rules_key(rules)):
+        print(f"Snapshot {path} was taken with other columns, rules or an older version; comparing every row")
+        return None
+    return snapshot['rows']
+
+
+def save_snapshot(path, status_columns, keys, input_hashes, output_hashes, status_matrix, rules=None):
+    """Function to store the key, side hashes and status of every row whose key is unique for the next run."""
+    unique_rows = (keys.notna() & ~keys.duplicated(keep=False)).to_numpy()
+    rows = pd.DataFrame({'input_hash': input_hashes[unique_rows], 'output_hash': output_hashes[unique_rows]},
+                        index=pd.Index(keys.to_numpy()[unique_rows], name='key'))
+    for status_column in status_columns:
+        rows[status_column] = status_matrix.column_mismatches(status_column)[unique_rows]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.to_pickle({'version': SNAPSHOT_VERSION, 'status_columns': sorted(status_columns), 'rules': rules_key(rules),
+                  'rows': rows}, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def make_incremental_status_builder(snapshot_name, primary_column, snapshot_dir=SNAPSHOT_DIR,
+                                    status_builder=build_status_matrix):
+    """Function to build a reconcile_frames status_builder that only compares rows changed since the last run.
+
+    A row reuses its earlier status when its key is unique in both runs and
+    the hashes of its normalized _Input and _Output values are unchanged;
+    every other row is compared, by status_builder. The snapshot is then
+    replaced with this run.
+    """
+    path = snapshot_path(snapshot_name, snapshot_dir)
+
+    def build_incremental_status_matrix(matched_df, base_columns, rules=None):
+        base_columns = compared_base_columns(base_columns, rules)
+        status_columns = [f'{base_column}_Status' for base_column in base_columns]
+        keys = row_keys(matched_df, primary_column)
+        # Hash the columns in a fixed order, as base_columns comes from a set
+        input_hashes = row_hashes(matched_df, [f'{base_column}_Input' for base_column in sorted(base_columns)])
+        output_hashes = row_hashes(matched_df, [f'{base_column}_Output' for base_column in sorted(base_columns)])
+
+        # Rows whose key and both side hashes match the snapshot keep their earlier status
+        reused = np.zeros(len(matched_df), dtype=bool)
+        previous = load_snapshot(path, status_columns, rules)
+        if previous is not None:
+            unique_rows = (keys.notna() & ~keys.duplicated(keep=False)).to_numpy()
+            positions = previous.index.get_indexer(keys.to_numpy())
+            found = unique_rows & (positions >= 0)
+            reused[found] = ((previous['input_hash'].to_numpy()[positions[found]] == input_hashes[found])
+                             & (previous['output_hash'].to_numpy()[positions[found]] == output_hashes[found]))
+        changed = np.flatnonzero(~reused)
+        print(f"Reusing the status of {int(reused.sum())} unchanged rows, comparing {len(changed)} rows")
+
+        changed_matrix = status_builder(matched_df.iloc[changed], base_columns, rules)
+        status_matrix = StatusMatrix(len(matched_df))
+        for status_column in status_columns:
+            mismatches = np.zeros(len(matched_df), dtype=bool)
+            if previous is not None:
+                mismatches[reused] = previous[status_column].to_numpy()[positions[reused]]
+            mismatches[changed] = changed_matrix.column_mismatches(status_column)
+            status_matrix.add_column(status_column, mismatches)
+
+        save_snapshot(path, status_columns, keys, input_hashes, output_hashes, status_matrix, rules)
+        return status_matrix
+
+    return build_incremental_status_matrix
@@ -0,0 +1,520 @@
+import os
+import math
+import glob
+import shutil
+import tempfile
+import pandas as pd
+import numpy as np
+from pandas._libs.parsers import STR_NA_VALUES
+from openpyxl import Workbook, load_workbook
+from compare_engine import (load_rules, clean_text, get_base_columns, merge_on_key, reconcile_frames, mismatch_labels,
+                            key_columns, key_values, key_codes, KEY_INDEX_COLUMN, ORDINAL_COLUMN)
+from excel_output import EXCEL_MAX_ROWS, SHARD_INDEX_COLUMNS, ShardedSheet, iter_sheet_rows
+
+# Memory one bucket pair (both sides plus the merged output) may use
+DEFAULT_MEMORY_BUDGET_MB = 1024
+
+# Rows read from an input file at a time while spilling
+CHUNK_ROWS = 50000
+
+# Rough in-memory size of a parsed frame relative to the file on disk
+EXPANSION_FACTORS = {'.xlsx': 10, '.xlsm': 10, '.csv': 3}
+
+
+def convert_cell(value):
+    """Function to convert a raw cell value the way pd.read_excel does.
+
+    Empty cells and text in pandas' default na_values ('NA', 'N/A',
+    'null', '#N/A', ...) are NaN, whole floats are ints.
+    """
+    if value is None or (isinstance(value, str) and value in STR_NA_VALUES):
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def read_excel_chunks(file_path, sheet_name=None, chunk_rows=CHUNK_ROWS):
+    """Function to stream a worksheet (or CSV file) as DataFrames of at most chunk_rows rows."""
+    if file_path.lower().endswith('.csv'):
+        yield from pd.read_csv(file_path, chunksize=chunk_rows)
+        return
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, ())
+        columns = [name if name is not None else f'Unnamed: {position}' for position, name in enumerate(header)]
+
+        # Chunks continue the row numbers of the ones before, like the chunks of pd.read_csv
+        chunk = []
+        start = 0
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            row = [convert_cell(value) for value in row[:len(columns)]]
+            chunk.append(row + [np.nan] * (len(columns) - len(row)))
+            if len(chunk) >= chunk_rows:
+                yield pd.DataFrame(chunk, columns=columns, index=pd.RangeIndex(start, start + len(chunk)))
+                start += len(chunk)
+                chunk = []
+        if chunk or not start:
+            yield pd.DataFrame(chunk, columns=columns, index=pd.RangeIndex(start, start + len(chunk)))
+    finally:
+        workbook.close()
+
+
+def plan_bucket_count(file_paths, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    """Function to pick how many spill buckets keep one bucket pair within the memory budget."""
+    estimated_bytes = sum(os.path.getsize(file_path) * EXPANSION_FACTORS.get(os.path.splitext(file_path)[1].lower(), 10)
+                          for file_path in file_paths)
+    return max(1, math.ceil(estimated_bytes / (memory_budget_mb * 1024 * 1024)))
+
+
+def canonical_keys(keys):
+    """Function to spell every key of a column as text, numbers (and numbers stored as text) as floats.
+
+    Keys the merge may pair are then spelt alike, whether a chunk read them
+    as int, float or text; whether '5' and 5 really pair is only known once
+    the whole file has been read (see file_dtype).
+    """
+    if pd.api.types.is_numeric_dtype(keys) and not pd.api.types.is_bool_dtype(keys):
+        return keys.astype('float64').astype(str)
+    text = keys.astype(str)
+    if keys.dtype == object:
+        numbers = pd.to_numeric(keys, errors='coerce')
+        parsed = numbers.notna()
+        text[parsed] = numbers[parsed].astype('float64').astype(str)
+    return text
+
+
+def bucket_of(keys, n_buckets):
+    """Function to assign every key to a bucket by hash, so equal keys on both sides land in the same bucket.
+
+    keys is a Series, or a frame with one column per part of a composite key.
+    """
+    if isinstance(keys, pd.DataFrame):
+        keys = pd.DataFrame({col: canonical_keys(keys[col]) for col in keys.columns})
+    else:
+        keys = canonical_keys(keys)
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy() % n_buckets
+
+
+def spill_to_buckets(file_path, sheet_name, primary_column, n_buckets, spill_dir, side, chunk_rows=CHUNK_ROWS):
+    """Function to partition one input file into on-disk buckets by hash of the primary column."""
+    columns = []
+    for part, chunk in enumerate(read_excel_chunks(file_path, sheet_name, chunk_rows)):
+        columns = list(chunk.columns)
+        for bucket, bucket_df in chunk.groupby(bucket_of(key_values(chunk, primary_column), n_buckets)):
+            bucket_df.to_pickle(os.path.join(spill_dir, f'{side}_{bucket}_{part}.pkl'))
+    return columns
+
+
+def load_bucket(spill_dir, side, bucket, columns):
+    """Function to load every spilled part of one bucket of one side, indexed by row number in the file."""
+    part_files = sorted(glob.glob(os.path.join(spill_dir, f'{side}_{bucket}_*.pkl')),
+                        key=lambda path: int(path.rsplit('_', 1)[1].split('.')[0]))
+    if not part_files:
+        return pd.DataFrame(columns=columns)
+    return pd.concat([pd.read_pickle(part_file) for part_file in part_files])
+
+
+def spilled_buckets(spill_dir, n_buckets):
+    """Function to list the buckets that hold rows of either side."""
+    return [bucket for bucket in range(n_buckets)
+            if any(glob.glob(os.path.join(spill_dir, f'{side}_{bucket}_*.pkl')) for side in ('input', 'query'))]
+
+
+def file_dtype(series):
+    """Function to tell the dtype pd.read_excel gives a column of these values; text that is all numbers is a number."""
+    if series.dtype == object:
+        try:
+            return pd.to_numeric(series).dtype
+        except (ValueError, TypeError):
+            pass
+    return series.dtype
+
+
+def fold_column_dtypes(dtypes, df):
+    """Function to fold the column dtypes of one part of a file into the dtypes seen so far for that file.
+
+    A column read as int in one part and float in another is float in one
+    read of the whole file, and any other mix is object.
+    """
+    if df.empty:
+        return dtypes
+    for col in df.columns:
+        dtype = file_dtype(df[col])
+        previous = dtypes.get(col, dtype)
+        if previous != dtype:
+            numeric = previous.kind in 'iuf' and dtype.kind in 'iuf'
+            dtype = np.dtype('float64') if numeric else np.dtype(object)
+        dtypes[col] = dtype
+    return dtypes
+
+
+def conform_to_file(df, dtypes):
+    """Function to give the columns of one part of a file the dtypes one read of the whole file would give them."""
+    for col, dtype in dtypes.items():
+        if df[col].dtype == dtype:
+            continue
+        if dtype == object and not df.empty:
+            # A float chunk holds whole numbers as floats; a mixed column reads them as ints
+            df[col] = df[col].astype(object).map(lambda value: int(value)
+                                                 if isinstance(value, float) and value.is_integer() else value)
+        elif df[col].dtype == object and dtype.kind in 'iuf':
+            # Numbers stored as text, in a column that holds nothing but numbers in the whole file
+            df[col] = pd.to_numeric(df[col]).astype(dtype)
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def conform_pairs(pairs, input_dtypes, query_dtypes):
+    """Function to give the frame pairs the column dtypes of their whole files."""
+    for input_df, query_df in pairs:
+        yield conform_to_file(input_df, input_dtypes), conform_to_file(query_df, query_dtypes)
+
+
+def merge_gaps(input_df, query_df, primary_column):
+    """Function to tell which sides a merge of this pair leaves gaps in (keys found on the other side only)."""
+    input_codes, query_codes, _ = key_codes(input_df, query_df, primary_column)
+    return [not np.isin(query_codes, input_codes).all(), not np.isin(input_codes, query_codes).all()]
+
+
+def widen_like_full_merge(input_df, query_df, gaps):
+    """Function to turn integer columns into float on each side the full outer merge would leave gaps in.
+
+    A side gets missing values in the merge when the other side has keys
+    it lacks, which makes its integer columns float. gaps holds this for
+    the whole files, so every pair compares the same types as one merge of
+    the whole files, whichever keys it happens to hold.
+    """
+    frames = []
+    for df, has_gaps in zip((input_df, query_df), gaps):
+        integer_columns = [col for col in df.columns if col not in (KEY_INDEX_COLUMN, ORDINAL_COLUMN)
+                           and df[col].dtype.kind in 'iu']
+        if has_gaps and integer_columns:
+            df = df.astype({col: 'float64' for col in integer_columns})
+        frames.append(df)
+    return frames
+
+
+def profile_pairs(pairs, primary_column, find_gaps=True):
+    """Function to read frame pairs once for what only the whole files tell.
+
+    Returns the column dtypes of both files (see fold_column_dtypes) and
+    which sides the full merge leaves gaps in. The gaps are found on the
+    keys as the pairs hold them, so those must already have the type of
+    their whole file.
+    """
+    input_dtypes, query_dtypes = {}, {}
+    gaps = [False, False]
+    for input_df, query_df in pairs:
+        fold_column_dtypes(input_dtypes, input_df)
+        fold_column_dtypes(query_dtypes, query_df)
+        if find_gaps and not all(gaps):
+            gaps = [known or found for known, found in zip(gaps, merge_gaps(input_df, query_df, primary_column))]
+    return input_dtypes, query_dtypes, gaps
+
+
+def profile_buckets(spill_dir, n_buckets, input_columns, query_columns, primary_column, find_gaps=True):
+    """Function to read the spilled buckets for the dtypes of both files and the sides the full merge leaves gaps in.
+
+    Returns the buckets holding any rows, the dtypes and the gaps. A key
+    stored as text may only turn into a number once the whole file is
+    known, so the gaps are found in a second read of the buckets.
+    """
+    buckets = spilled_buckets(spill_dir, n_buckets)
+    input_dtypes, query_dtypes, _ = profile_pairs(bucket_pairs(spill_dir, buckets, input_columns, query_columns),
+                                                  primary_column, find_gaps=False)
+    gaps = [False, False]
+    if find_gaps:
+        _, _, gaps = profile_pairs(conform_pairs(bucket_pairs(spill_dir, buckets, input_columns, query_columns),
+                                                 input_dtypes, query_dtypes), primary_column)
+    return buckets, input_dtypes, query_dtypes, gaps
+
+
+class KeysNotSortedError(ValueError):
+    """Raised when a file read in key order turns out not to be sorted on the key."""
+
+
+def check_key_order(chunks, primary_column, side):
+    """Function to pass the chunks of one file through, raising KeysNotSortedError once its keys go down."""
+    last_key = None
+    for chunk in chunks:
+        keys = chunk[primary_column]
+        # Text keys that are numbers may be read as numbers in the merge, which orders them differently
+        if keys.dtype == object and pd.to_numeric(keys, errors='coerce').notna().any():
+            raise KeysNotSortedError(f"The {side} file has numbers stored as text in {primary_column}")
+        try:
+            in_order = (not keys.hasnans and keys.is_monotonic_increasing
+                        and (last_key is None or keys.empty or not keys.iloc[0] < last_key))
+        except TypeError:
+            in_order = False
+        if not in_order:
+            raise KeysNotSortedError(f"The {side} file is not sorted on {primary_column}")
+        if not keys.empty:
+            last_key = keys.iloc[-1]
+        yield chunk
+
+
+def sorted_pairs(business_file, query_file, primary_column, chunk_rows=CHUNK_ROWS):
+    """Function to read two files sorted on the key side by side and cut them into aligned frame pairs.
+
+    A pair holds every row of its keys on both sides, so the pairs can be
+    reconciled one at a time without hashing the keys into spill buckets.
+    Each file is read once; only the rows of keys not yet complete on both
+    sides stay in memory. Raises KeysNotSortedError when a file is not sorted.
+    """
+    chunks = [check_key_order(read_excel_chunks(business_file, 'Sheet1', chunk_rows), primary_column, 'business'),
+              check_key_order(read_excel_chunks(query_file, None, chunk_rows), primary_column, 'system')]
+    pending = [None, None]
+    done = [False, False]
+    while not all(done):
+        # Read on from every side that has nothing pending or whose pending keys end first
+        last_keys = [pending[side][primary_column].iloc[-1] if pending[side] is not None and not pending[side].empty
+                     else None for side in (0, 1)]
+        open_last_keys = [key for side, key in enumerate(last_keys) if not done[side] and key is not None]
+        try:
+            lowest = min(open_last_keys) if open_last_keys else None
+        except TypeError:
+            raise KeysNotSortedError("The keys of the two files cannot be ordered against each other")
+        for side in (0, 1):
+            if not done[side] and (last_keys[side] is None or last_keys[side] == lowest):
+                chunk = next(chunks[side], None)
+                if chunk is None:
+                    done[side] = True
+                else:
+                    pending[side] = chunk if pending[side] is None else pd.concat([pending[side], chunk],
+                                                                                  ignore_index=True)
+
+        # Keys below the last key read from each side still being read are complete on both sides
+        if any(not done[side] and (pending[side] is None or pending[side].empty) for side in (0, 1)):
+            continue
+        open_last_keys = [pending[side][primary_column].iloc[-1] for side in (0, 1) if not done[side]]
+        if not open_last_keys:
+            break
+        try:
+            boundary = min(open_last_keys)
+            cuts = [np.searchsorted(pending[side][primary_column].to_numpy(), boundary, side='left')
+                    if pending[side] is not None else 0 for side in (0, 1)]
+        except TypeError:
+            raise KeysNotSortedError("The keys of the two files cannot be ordered against each other")
+        if cuts[0] or cuts[1]:
+            yield pending[0].iloc[:cuts[0]].reset_index(drop=True), pending[1].iloc[:cuts[1]].reset_index(drop=True)
+            pending = [pending[side].iloc[cuts[side]:] if pending[side] is not None else None for side in (0, 1)]
+
+    if not (pending[0].empty and pending[1].empty):
+        yield pending[0].reset_index(drop=True), pending[1].reset_index(drop=True)
+
+
+def bucket_pairs(spill_dir, buckets, input_columns, query_columns, progress=False):
+    """Function to load the spilled buckets of both sides pair by pair."""
+    for position, bucket in enumerate(buckets, 1):
+        if progress:
+            print(f"Reconciling bucket {position} of {len(buckets)}")
+        yield load_bucket(spill_dir, 'input', bucket, input_columns), load_bucket(spill_dir, 'query', bucket,
+                                                                                  query_columns)
+
+
+class ResultWriter:
+    """Write-only output workbook that reconciled frame pairs are added to one at a time.
+
+    Every pair must hold all rows of its keys on both sides. 'Row Number'
+    refers to the row position in the Matched Data sheet, as in newCode.py.
+    extra_sheets are created between Mismatch Data and Summary Data for
+    frames added with add_rows. Sheets that outgrow max_rows continue on
+    numbered sheets, listed below the summary.
+    """
+
+    def __init__(self, primary_column, max_rows=EXCEL_MAX_ROWS, extra_sheets=()):
+        self.primary_column = primary_column
+        self.workbook = Workbook(write_only=True)
+        self.matched_sheet = ShardedSheet(self.workbook, 'Matched Data', max_rows)
+        self.mismatch_sheet = ShardedSheet(self.workbook, 'Mismatch Data', max_rows)
+        self.extra_sheets = {sheet_name: ShardedSheet(self.workbook, sheet_name, max_rows)
+                             for sheet_name in extra_sheets}
+        self.summary_sheet = self.workbook.create_sheet('Summary Data')
+        # A composite key is shown one column per part, like build_mismatch_frame
+        key_labels = (['Id_Input'] if len(key_columns(primary_column)) == 1
+                      else [f'{column}_Input' for column in key_columns(primary_column)])
+        self.mismatch_sheet.append_header(['Row Number'] + key_labels + ['Not Matched Columns'])
+        self.layout = None
+        self.status_columns = []
+        self.error_counts = {}
+        self.rows_written = 0
+
+    def add_pair(self, matched_df, status_matrix):
+        """Function to append the rows of one reconciled pair and its mismatched rows."""
+        if self.layout is None:
+            self.layout = list(matched_df.columns)
+            self.status_columns = status_matrix.status_columns
+            self.matched_sheet.append_header(self.layout)
+        for row in iter_sheet_rows(matched_df[self.layout]):
+            self.matched_sheet.append(row)
+
+        for status_column in self.status_columns:
+            self.error_counts[status_column] = (self.error_counts.get(status_column, 0)
+                                                + status_matrix.column_error_count(status_column))
+
+        rows = status_matrix.mismatch_rows()
+        labels = mismatch_labels(status_matrix.mismatch_matrix(rows),
+                                 [col.replace('_Status', '') for col in self.status_columns])
+        keys = key_values(matched_df, self.primary_column, '_Input').iloc[rows]
+        keys = keys.to_frame() if isinstance(keys, pd.Series) else keys
+        for row, key, label in zip(rows, iter_sheet_rows(keys), labels):
+            # Row numbers in Excel are 1-based
+            self.mismatch_sheet.append([self.rows_written + row + 1] + list(key) + [label])
+        self.rows_written += len(matched_df)
+
+    def add_rows(self, sheet_name, df):
+        """Function to append the rows of df to one of the extra sheets, headed by its columns."""
+        sheet = self.extra_sheets[sheet_name]
+        if sheet.header is None:
+            sheet.append_header(df.columns)
+        for row in iter_sheet_rows(df):
+            sheet.append(row)
+
+    def drop_sheet(self, sheet_name):
+        """Function to leave one of the extra sheets out of the workbook."""
+        for part in self.extra_sheets.pop(sheet_name).parts:
+            worksheet = self.workbook[part[2]]
+            worksheet.close()
+            self.workbook.remove(worksheet)
+
+    def summary_frame(self):
+        """Function to build the Summary Data frame, counted over the written Matched Data rows like newCode.py."""
+        total_count = self.rows_written + 1
+        summary_data = []
+        for status_column in self.status_columns:
+            error_count = self.error_counts[status_column]
+            error_percentage = (error_count * 100.0) / total_count if total_count > 0 else 0
+            summary_data.append({
+                'Column': status_column,
+                'Total Matched': self.rows_written - error_count,
+                'Error': error_count,
+                'Percent Error': f"{error_percentage:.2f}%"
+            })
+        summary_df = pd.DataFrame(summary_data, columns=['Column', 'Total Matched', 'Error', 'Percent Error'])
+        return summary_df.set_index('Column')
+
+    def finish(self):
+        """Function to add the unique column names row and the summary; returns the workbook and summary frame."""
+        # Add unique column names row
+        if self.layout is not None:
+            self.matched_sheet.append(self.layout)
+
+        # Add summary rows
+        summary_df = self.summary_frame()
+        self.summary_sheet.append(['Column', 'Total Matched', 'Error', 'Percent Error'])
+        for row in iter_sheet_rows(summary_df.reset_index()):
+            self.summary_sheet.append(row)
+
+        # Point to the numbered sheets of any sheet that did not fit
+        split_parts = [part for sheet in [self.matched_sheet, self.mismatch_sheet] + list(self.extra_sheets.values())
+                       if len(sheet.parts) > 1 for part in sheet.parts]
+        if split_parts:
+            self.summary_sheet.append([])
+            self.summary_sheet.append(SHARD_INDEX_COLUMNS)
+            for part in split_parts:
+                self.summary_sheet.append(part)
+        return self.workbook, summary_df
+
+    def discard(self):
+        """Function to finish the sheets of a workbook that will not be saved, so their temporary files are closed."""
+        for worksheet in self.workbook.worksheets:
+            worksheet.close()
+
+
+def reconcile_pairs(pairs, primary_column, clean_func=clean_text, max_rows=EXCEL_MAX_ROWS, rules=None,
+                    gaps=(False, False)):
+    """Function to reconcile frame pairs one at a time and write them into a write-only workbook (ResultWriter).
+
+    The pairs hold the column dtypes of their whole files (conform_pairs)
+    and gaps tells which sides the full merge leaves gaps in.
+    """
+    writer = ResultWriter(primary_column, max_rows)
+    base_columns = None
+    try:
+        for input_df, query_df in pairs:
+            if base_columns is None:
+                # Fix the compared columns once so every pair produces the same layout
+                base_columns = get_base_columns(merge_on_key(pd.DataFrame(columns=input_df.columns),
+                                                             pd.DataFrame(columns=query_df.columns), primary_column))
+            input_df, query_df = widen_like_full_merge(input_df, query_df, gaps)
+            writer.add_pair(*reconcile_frames(input_df, query_df, primary_column, clean_func, base_columns,
+                                              rules=rules))
+    except Exception:
+        writer.discard()
+        raise
+    return writer.finish()[0]
+
+
+def main(business_file, query_file, primary_column, output_file, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB,
+         spill_dir=None, chunk_rows=CHUNK_ROWS, clean_func=clean_text, max_rows=EXCEL_MAX_ROWS, rules_file=None,
+         presorted=None):
+    """Reconcile two files so that only part of them is in memory at a time.
+
+    When both files are sorted on a one-column key they are read side by
+    side and reconciled in key order, with no spilling. Otherwise they are
+    spilled to disk in hash buckets and reconciled bucket by bucket; the
+    rows of the output are then grouped by bucket instead of following the
+    key order. presorted=None tries the sorted reading first and falls back
+    to buckets, True requires sorted files and False always spills.
+    """
+    work_dir = None
+    try:
+        rules = load_rules(rules_file) if rules_file else None
+        workbook = None
+        if presorted is not False and len(key_columns(primary_column)) == 1:
+            try:
+                print(f"Reading {business_file} and {query_file} side by side in key order")
+                # A first read fixes the column types and merge gaps of the whole files, as pd.read_excel sees them
+                input_dtypes, query_dtypes, gaps = profile_pairs(
+                    sorted_pairs(business_file, query_file, primary_column, chunk_rows), primary_column)
+                pairs = conform_pairs(sorted_pairs(business_file, query_file, primary_column, chunk_rows),
+                                      input_dtypes, query_dtypes)
+                workbook = reconcile_pairs(pairs, primary_column, clean_func, max_rows, rules, gaps)
+            except KeysNotSortedError as e:
+                if presorted:
+                    raise
+                print(f"{e}; spilling into buckets instead")
+        elif presorted:
+            raise ValueError("Reading sorted files side by side needs a one-column key")
+
+        if workbook is None:
+            work_dir = tempfile.mkdtemp(prefix='reconcile_', dir=spill_dir)
+            n_buckets = plan_bucket_count([business_file, query_file], memory_budget_mb)
+            print(f"Spilling {business_file} and {query_file} into {n_buckets} buckets under {work_dir}")
+            input_columns = spill_to_buckets(business_file, 'Sheet1', primary_column, n_buckets, work_dir, 'input',
+                                             chunk_rows)
+            query_columns = spill_to_buckets(query_file, None, primary_column, n_buckets, work_dir, 'query',
+                                             chunk_rows)
+            print("Profiling the buckets")
+            buckets, input_dtypes, query_dtypes, gaps = profile_buckets(work_dir, n_buckets, input_columns,
+                                                                        query_columns, primary_column)
+            pairs = conform_pairs(bucket_pairs(work_dir, buckets, input_columns, query_columns, progress=True),
+                                  input_dtypes, query_dtypes)
+            workbook = reconcile_pairs(pairs, primary_column, clean_func, max_rows, rules, gaps)
+
+        output_file_path = fr"D:\Work\Output_Sheets\{output_file}_output.xlsx"
+        print(f"Saving results to {output_file_path}")
+        workbook.save(output_file_path)
+        print("File Created Successfully.............")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    business_file = fr"D:\Work\Input_Sheets\UserRole_Source.xlsx"
+    query_file = fr"D:\Work\Input_Sheets\UserRole_Target.xlsx"
+    primary_column = 'Id'
+    output_file = "delete1_streamed"
+    main(business_file, query_file, primary_column, output_file, memory_budget_mb=512)
@@ -0,0 +1,25 @@
+import json
+
+import pytest
+
+import batch_runner
+
+
+def write_manifest(tmp_path, jobs):
+    """Function to write the jobs as a JSON manifest and return its path."""
+    manifest_path = tmp_path / 'manifest.json'
+    manifest_path.write_text(json.dumps(jobs), encoding='utf-8')
+    return str(manifest_path)
+
+
+JOB = {'business_file': 'business.xlsx', 'query_file': 'system.xlsx', 'primary_column': 'Id', 'output_file': 'out'}
+
+
+def test_manifest_defaults_to_newCode(tmp_path):
+    jobs = batch_runner.load_manifest(write_manifest(tmp_path, [JOB, dict(JOB, script='streaming_compare')]))
+    assert [job['script'] for job in jobs] == ['newCode', 'streaming_compare']
+
+
+def test_manifest_rejects_unknown_script(tmp_path):
+    with pytest.raises(ValueError, match="unknown script 'os'"):
+        batch_runner.load_manifest(write_manifest(tmp_path, [JOB, dict(JOB, script='os')]))
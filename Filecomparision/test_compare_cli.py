@@ -0,0 +1,50 @@
+import os
+import sys
+import json
+import time
+import subprocess
+
+import pytest
+
+COMPARE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'compare.py')
+
+# Seconds compare --help may take, interpreter start-up included; it takes about 0.1 s without pandas
+HELP_SECONDS_BUDGET = 2.0
+
+# Modules the help of every subcommand must not import
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl')
+
+# Runs compare.py as __main__ with the given arguments and prints the heavy modules it imported
+PROBE = """
+import sys, json, runpy
+sys.argv = [sys.argv[1]] + sys.argv[2:]
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+except SystemExit:
+    pass
+sys.stdout = sys.__stdout__
+print(json.dumps([name for name in %r if name in sys.modules]))
+""" % (HEAVY_MODULES,)
+
+
+def run_help(*args):
+    """Function to run compare.py with the given arguments in a fresh interpreter; returns (seconds, heavy modules)."""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', PROBE, COMPARE_SCRIPT, *args], capture_output=True, text=True,
+                               timeout=60, cwd=os.path.dirname(COMPARE_SCRIPT))
+    seconds = time.perf_counter() - start
+    assert completed.returncode == 0, completed.stderr
+    assert 'usage:' in completed.stdout
+    return seconds, json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def test_help_is_fast_and_does_not_import_pandas():
+    seconds, imported = run_help('--help')
+    assert imported == []
+    assert seconds < HELP_SECONDS_BUDGET, f"compare --help took {seconds:.2f} s"
+
+
+@pytest.mark.parametrize('subcommand', ['run', 'stream', 'batch', 'serve', 'distribute', 'worker', 'remote', 'share'])
+def test_subcommand_help_does_not_import_pandas(subcommand):
+    _, imported = run_help(subcommand, '--help')
+    assert imported == []
@@ -0,0 +1,96 @@
+import os
+import multiprocessing
+from multiprocessing.connection import Listener
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import newCode
+import distributed_compare
+
+AUTHKEY = b'test-key'
+
+
+def write_inputs(tmp_path, business_df, system_df):
+    """Function to write the business (Sheet1) and system workbooks and return their paths."""
+    business_file, system_file = str(tmp_path / 'business.xlsx'), str(tmp_path / 'system.xlsx')
+    with pd.ExcelWriter(business_file) as writer:
+        business_df.to_excel(writer, sheet_name='Sheet1', index=False)
+    system_df.to_excel(system_file, index=False)
+    return business_file, system_file
+
+
+def sample_frames():
+    """Function to build a business/system pair with changed cells, repeated keys and keys on one side only."""
+    n_rows = 60
+    business_df = pd.DataFrame({'Id': np.arange(n_rows) % 50, 'Qty': np.arange(n_rows) * 1.5,
+                                'Code': np.arange(n_rows) % 7, 'Name': [f'Name {i}' for i in range(n_rows)]})
+    system_df = business_df.assign(Code=business_df['Code'].astype(str), Name=business_df['Name'].str.upper())
+    system_df.loc[[3, 20], 'Qty'] = -1.0
+    system_df = pd.concat([system_df.drop(index=[7, 8]),
+                           pd.DataFrame({'Id': [200, 201], 'Qty': [1.0, 2.0], 'Code': ['1', '2'], 'Name': ['x', 'y']})])
+    return business_df, system_df
+
+
+def sorted_sheet(sheets, sheet_name):
+    """Function to sort a result sheet on all its columns, as partitions change the row order."""
+    df = sheets[sheet_name]
+    if sheet_name == 'Matched Data':
+        df = df.iloc[:-1]  # the column names row
+    return df.sort_values(list(df.columns), ignore_index=True)
+
+
+def assert_same_results(full_path, distributed_path, sheet_names):
+    """Function to check that two result workbooks hold the same rows and the same summary."""
+    full = pd.read_excel(full_path, sheet_name=None)
+    distributed = pd.read_excel(distributed_path, sheet_name=None)
+    for sheet_name in sheet_names:
+        pd.testing.assert_frame_equal(sorted_sheet(distributed, sheet_name), sorted_sheet(full, sheet_name))
+    pd.testing.assert_frame_equal(distributed['Summary Data'], full['Summary Data'])
+
+
+@pytest.mark.parametrize('options', [{}, {'orphan_sheet': True, 'duplicate_strategy': 'ordinal'}])
+def test_local_workers_match_newCode(tmp_path, monkeypatch, options):
+    monkeypatch.chdir(tmp_path)
+    business_file, system_file = write_inputs(tmp_path, *sample_frames())
+
+    full_paths, _ = newCode.main(business_file, system_file, 'Id', 'full', **options)
+    distributed_paths, _ = distributed_compare.main(business_file, system_file, 'Id', 'distributed', workers=2,
+                                                    partitions=6, chunk_rows=9, **options)
+
+    sheet_names = ['Matched Data'] + (['Orphan Keys'] if options else [])
+    assert_same_results(full_paths[0], distributed_paths[0], sheet_names)
+
+
+def serve_one_partition_then_die(ready):
+    """Function to accept a coordinator, take its first partition and exit without answering, like a killed worker."""
+    with Listener(('127.0.0.1', 0), authkey=AUTHKEY) as listener:
+        ready.send(listener.address)
+        connection = listener.accept()
+        connection.recv()
+        os._exit(1)
+
+
+def test_lost_worker_partition_is_retried(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    business_file, system_file = write_inputs(tmp_path, *sample_frames())
+
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    dying_worker = multiprocessing.Process(target=serve_one_partition_then_die, args=(sender,), daemon=True)
+    dying_worker.start()
+    dying_address = receiver.recv()
+    live_workers, live_addresses = distributed_compare.start_local_workers(1, AUTHKEY)
+    try:
+        full_paths, _ = newCode.main(business_file, system_file, 'Id', 'full')
+        result = distributed_compare.main(business_file, system_file, 'Id', 'distributed',
+                                          workers=[dying_address] + live_addresses, authkey=AUTHKEY, partitions=6,
+                                          chunk_rows=9)
+    finally:
+        for process in live_workers + [dying_worker]:
+            process.terminate()
+            process.join()
+
+    assert 'will be retried' in capsys.readouterr().out
+    assert result is not None
+    assert_same_results(full_paths[0], result[0][0], ['Matched Data'])
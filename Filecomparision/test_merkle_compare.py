@@ -0,0 +1,78 @@
+from multiprocessing.connection import Client
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import newCode
+import merkle_compare
+from streaming_compare import bucket_of
+
+AUTHKEY = b'test-key'
+
+ROWS_PER_BUCKET = 16
+
+
+def write_inputs(tmp_path, business_df, system_df):
+    """Function to write the business (Sheet1) and system workbooks and return their paths."""
+    business_file, system_file = str(tmp_path / 'business.xlsx'), str(tmp_path / 'system.xlsx')
+    with pd.ExcelWriter(business_file) as writer:
+        business_df.to_excel(writer, sheet_name='Sheet1', index=False)
+    system_df.to_excel(system_file, index=False)
+    return business_file, system_file
+
+
+def sample_frames(changed_id, system_only_column=False):
+    """Function to build a business file and a system file that differs from it in one row."""
+    n_rows = 500
+    business_df = pd.DataFrame({'Id': np.arange(n_rows), 'Qty': np.arange(n_rows) * 2,
+                                'Name': [f'name {i}' for i in range(n_rows)]})
+    system_df = business_df.copy()
+    system_df.loc[system_df['Id'] == changed_id, 'Qty'] = -1
+    if system_only_column:
+        system_df['SysCode'] = [f'S{i}' for i in range(n_rows)]
+    return business_df, system_df
+
+
+def test_only_the_changed_bucket_is_fetched(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    business_df, system_df = sample_frames(changed_id=123)
+    business_file, system_file = write_inputs(tmp_path, business_df, system_df)
+
+    system_side, address = merkle_compare.start_local_side(system_file, 0, AUTHKEY)
+    try:
+        with Client(address, authkey=AUTHKEY) as connection:
+            query_df = merkle_compare.fetch_system_frame(pd.read_excel(business_file, sheet_name='Sheet1'),
+                                                         connection, 'Id', ROWS_PER_BUCKET)
+            connection.send(('close',))
+    finally:
+        system_side.terminate()
+        system_side.join()
+
+    # Fetched rows keep their system row number; the business rows standing in for the others are numbered after
+    fetched = query_df[query_df.index < len(system_df)]
+    n_buckets = merkle_compare.plan_tree_buckets(len(system_df), ROWS_PER_BUCKET)
+    buckets = bucket_of(system_df['Id'], n_buckets)
+    changed_bucket = buckets[system_df['Id'] == 123][0]
+    assert sorted(fetched['Id']) == sorted(system_df['Id'][buckets == changed_bucket])
+    assert len(fetched) < len(system_df) // 4
+
+    # Together they hold every system row
+    pd.testing.assert_frame_equal(query_df.sort_values('Id', ignore_index=True), system_df)
+
+
+@pytest.mark.parametrize('system_only_column', [False, True])
+def test_merkle_output_matches_full_comparison(tmp_path, monkeypatch, system_only_column):
+    monkeypatch.chdir(tmp_path)
+    business_file, system_file = write_inputs(tmp_path, *sample_frames(77, system_only_column))
+
+    full_paths, _ = newCode.main(business_file, system_file, 'Id', 'full')
+    merkle_paths, _ = merkle_compare.main(business_file, system_file, 'Id', 'merkle', authkey=AUTHKEY,
+                                          rows_per_bucket=ROWS_PER_BUCKET)
+
+    full = pd.read_excel(full_paths[0], sheet_name=None)
+    merkle = pd.read_excel(merkle_paths[0], sheet_name=None)
+    assert list(merkle) == list(full)
+    for sheet_name in full:
+        pd.testing.assert_frame_equal(merkle[sheet_name], full[sheet_name])
+    assert full['Summary Data'].set_index('Column').loc['Qty_Status', 'Error'] == 1
@@ -0,0 +1,72 @@
+import pandas as pd
+
+import newCode2
+
+
+def run_newCode2(tmp_path, monkeypatch, business_df, system_df, primary_column, **options):
+    """Function to write both frames to workbooks, run newCode2.main on them and read back every output sheet."""
+    # The output path is a Windows path; elsewhere it is a file name in the working directory
+    monkeypatch.chdir(tmp_path)
+    with pd.ExcelWriter(tmp_path / 'business.xlsx') as writer:
+        business_df.to_excel(writer, sheet_name='Sheet1', index=False)
+    system_df.to_excel(tmp_path / 'system.xlsx', index=False)
+    result = newCode2.main(str(tmp_path / 'business.xlsx'), str(tmp_path / 'system.xlsx'), primary_column, 'keys',
+                           **options)
+    assert result is not None
+    written_paths, _ = result
+    return pd.read_excel(written_paths[0], sheet_name=None)
+
+
+def matched_rows(sheets):
+    """Function to drop the trailing column names row newCode2 adds to Matched Data."""
+    return sheets['Matched Data'].iloc[:-1]
+
+
+def test_orphan_pass_uses_the_normalized_key(tmp_path, monkeypatch):
+    business_df = pd.DataFrame({'Id': ['ABC', 'Two  Words', 'only-business'], 'Qty': [1, 2, 3]})
+    system_df = pd.DataFrame({'Id': ['abc', ' two words', 'only-system'], 'Qty': [1, 2, 4]})
+
+    sheets = run_newCode2(tmp_path, monkeypatch, business_df, system_df, 'Id', orphan_sheet=True)
+
+    # Keys differing only in case or whitespace pair in the merge, so they are not orphans
+    assert sorted(sheets['Orphan Keys']['Found Only In']) == ['Business', 'System']
+    assert sorted(matched_rows(sheets)['Id_Input']) == ['abc', 'two words']
+    assert (matched_rows(sheets)['Result'] == 'Pass').all()
+
+    # The same pairs as without the orphan sheet
+    plain = run_newCode2(tmp_path, monkeypatch, business_df, system_df, 'Id')
+    paired = matched_rows(plain).dropna(subset=['Id_Input', 'Id_Output'])
+    assert sorted(paired['Id_Input']) == ['abc', 'two words']
+
+
+def test_duplicate_pass_uses_the_normalized_key(tmp_path, monkeypatch):
+    business_df = pd.DataFrame({'Id': ['ABC', 'abc ', 'x'], 'Qty': [1, 2, 3]})
+    system_df = pd.DataFrame({'Id': ['Abc', 'X'], 'Qty': [1, 3]})
+
+    # 'ABC' and 'abc ' are one key repeated, so they show up in Duplicate Keys and the first of them is kept
+    sheets = run_newCode2(tmp_path, monkeypatch, business_df, system_df, 'Id', duplicate_strategy='first')
+    duplicate_df = sheets['Duplicate Keys']
+    assert list(duplicate_df['Id']) == ['abc']
+    assert list(duplicate_df['Business Rows']) == [2]
+    assert len(matched_rows(sheets)) == 2
+    assert (matched_rows(sheets)['Result'] == 'Pass').all()
+
+    # The ordinal strategy pairs the n-th rows of the normalized key instead of every pairing
+    sheets = run_newCode2(tmp_path, monkeypatch, business_df, system_df, 'Id', duplicate_strategy='ordinal')
+    assert len(matched_rows(sheets)) == 3
+
+
+def test_single_and_composite_keys_pair_the_same_mixed_case_rows(tmp_path, monkeypatch):
+    business_df = pd.DataFrame({'Region': ['EU', 'us', 'Apac'], 'Id': ['A1', 'b2', 'C3 '], 'Qty': [1, 2, 3]})
+    system_df = pd.DataFrame({'Region': ['eu', 'US', 'APAC'], 'Id': ['a1', 'B2', 'c3'], 'Qty': [1, 2, 3]})
+
+    single = run_newCode2(tmp_path, monkeypatch, business_df, system_df, 'Id')
+    composite = run_newCode2(tmp_path, monkeypatch, business_df, system_df, ['Region', 'Id'])
+
+    # Every key column is joined lower-cased and whitespace-collapsed, so the rows pair the same either way
+    for sheets in (single, composite):
+        rows = matched_rows(sheets)
+        assert len(rows) == 3
+        assert (rows['Qty_Status'] == 'Matched').all()
+        assert sorted(rows['Id_Input']) == sorted(rows['Id_Output']) == ['a1', 'b2', 'c3']
+    assert (matched_rows(composite)['Result'] == 'Pass').all()
@@ -0,0 +1,42 @@
+import os
+
+import pandas as pd
+import pytest
+
+import newCode
+import newCode2
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_workbooks')
+
+# business.xlsx and system.xlsx differ in text case and spacing, ints, floats, dates, blank and filled notes, bools
+# and one key on each side; the expected workbooks were written by the scripts before the null-aware comparison
+SAMPLE_SCRIPTS = {'newCode': newCode, 'newCode2': newCode2}
+
+
+def canonical_sheets(sheets):
+    """Function to put the columns and the Not Matched Columns lists in name order, as they follow set order."""
+    canonical = {}
+    for sheet_name, df in sheets.items():
+        if sheet_name == 'Summary Data':
+            df = df.sort_values('Column', ignore_index=True)
+        elif sheet_name == 'Mismatch Data':
+            df = df.assign(**{'Not Matched Columns': df['Not Matched Columns'].map(
+                lambda names: ', '.join(sorted(str(names).split(', '))))})
+        else:
+            df = df[sorted(df.columns)]
+        canonical[sheet_name] = df
+    return canonical
+
+
+@pytest.mark.parametrize('script_name', sorted(SAMPLE_SCRIPTS))
+def test_sample_workbook_outputs_are_unchanged(tmp_path, monkeypatch, script_name):
+    monkeypatch.chdir(tmp_path)
+    written_paths, _ = SAMPLE_SCRIPTS[script_name].main(os.path.join(SAMPLE_DIR, 'business.xlsx'),
+                                                        os.path.join(SAMPLE_DIR, 'system.xlsx'), 'Id', script_name)
+
+    expected = canonical_sheets(pd.read_excel(os.path.join(SAMPLE_DIR, f'{script_name}_expected.xlsx'),
+                                              sheet_name=None))
+    written = canonical_sheets(pd.read_excel(written_paths[0], sheet_name=None))
+    assert list(written) == list(expected)
+    for sheet_name in expected:
+        pd.testing.assert_frame_equal(written[sheet_name], expected[sheet_name])
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import newCode
+import streaming_compare
+
+
+def output_path(output_file):
+    """Function to give the workbook path the scripts save output_file to."""
+    return fr"D:\Work\Output_Sheets\{output_file}_output.xlsx"
+
+
+def write_inputs(tmp_path, business_df, system_df):
+    """Function to write the business (Sheet1) and system workbooks and return their paths."""
+    business_file, system_file = str(tmp_path / 'business.xlsx'), str(tmp_path / 'system.xlsx')
+    with pd.ExcelWriter(business_file) as writer:
+        business_df.to_excel(writer, sheet_name='Sheet1', index=False)
+    system_df.to_excel(system_file, index=False)
+    return business_file, system_file
+
+
+def sorted_matched_data(sheets):
+    """Function to sort Matched Data (without its column names row) on the key, as buckets change the row order."""
+    matched_df = sheets['Matched Data'].iloc[:-1]
+    return matched_df.sort_values(['Id_Input', 'Id_Output'], ignore_index=True)
+
+
+def code_digits_frames(orphans):
+    """Function to build a business file with an int Code column and a system file holding Code as text digits."""
+    n_rows = 40
+    business_df = pd.DataFrame({'Id': np.arange(n_rows), 'Code': np.arange(n_rows) % 7,
+                                'Qty': np.arange(n_rows) * 1.5, 'Name': [f'name {i}' for i in range(n_rows)]})
+    system_df = business_df.assign(Code=business_df['Code'].astype(str))
+    system_df.loc[3, 'Qty'] = 99.0
+    system_df.loc[8, 'Code'] = '9'
+    if orphans:
+        # Keys on one side only leave gaps in the merge, which turns the int columns of the other side into float
+        system_df = pd.concat([system_df.drop(index=[10, 11]),
+                               pd.DataFrame({'Id': [100], 'Code': ['3'], 'Qty': [1.0], 'Name': ['extra']})])
+    return business_df, system_df
+
+
+@pytest.mark.parametrize('orphans', [False, True])
+@pytest.mark.parametrize('presorted', [True, False])
+def test_streamed_output_matches_newCode(tmp_path, monkeypatch, presorted, orphans):
+    monkeypatch.chdir(tmp_path)
+    business_file, system_file = write_inputs(tmp_path, *code_digits_frames(orphans))
+
+    newCode.main(business_file, system_file, 'Id', 'full')
+    # Small chunks and a tiny memory budget, so the files are read in many pieces (or spilled into many buckets)
+    streaming_compare.main(business_file, system_file, 'Id', 'streamed', memory_budget_mb=0.001, chunk_rows=7,
+                           presorted=presorted)
+
+    full = pd.read_excel(output_path('full'), sheet_name=None)
+    streamed = pd.read_excel(output_path('streamed'), sheet_name=None)
+    pd.testing.assert_frame_equal(sorted_matched_data(streamed), sorted_matched_data(full))
+    pd.testing.assert_frame_equal(streamed['Summary Data'], full['Summary Data'])
+    # Only the changed Qty and Code cells (and the one-sided keys) are Not Matched
+    code_errors = full['Summary Data'].set_index('Column').loc['Code_Status', 'Error']
+    assert code_errors == (4 if orphans else 1)